@@ -0,0 +1,181 @@
+import os
+import math
+
+# Index types a store can be built with. "auto" picks one by corpus size.
+INDEX_TYPES = ("auto", "flat", "hnsw", "ivf", "ivfpq")
+
+# Corpus sizes (in chunks) at which "auto" moves to the next index type
+AUTO_HNSW_MIN = 20_000
+AUTO_IVF_MIN = 500_000
+AUTO_IVFPQ_MIN = 5_000_000
+
+# FAISS wants roughly this many training points per IVF centroid / PQ code
+MIN_POINTS_PER_CENTROID = 39
+PQ_CODES = 256
+MAX_TRAINING_POINTS = 256 * 1024
+
+DEFAULT_HNSW_M = 32
+DEFAULT_HNSW_EF_CONSTRUCTION = 80
+DEFAULT_HNSW_EF_SEARCH = 64
+DEFAULT_PQ_SUBVECTORS = 64
+
+
+def choose_index_type(count, requested=None):
+    """
+    Resolves the index type for a corpus of `count` vectors: an explicit
+    request (argument or VECTOR_INDEX_TYPE) wins, otherwise "auto" picks by size.
+    """
+    kind = (requested or os.getenv("VECTOR_INDEX_TYPE", "auto")).lower()
+    if kind not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type '{kind}'. Expected one of {', '.join(INDEX_TYPES)}.")
+    if kind == "auto":
+        if count >= AUTO_IVFPQ_MIN:
+            kind = "ivfpq"
+        elif count >= AUTO_IVF_MIN:
+            kind = "ivf"
+        elif count >= AUTO_HNSW_MIN:
+            kind = "hnsw"
+        else:
+            kind = "flat"
+    return kind
+
+def _default_nlist(count):
+    nlist = int(os.getenv("VECTOR_INDEX_NLIST", "0")) or int(4 * math.sqrt(count))
+    return max(1, min(nlist, count // MIN_POINTS_PER_CENTROID))
+
+def _pq_subvectors(dimension):
+    target = int(os.getenv("VECTOR_INDEX_PQ_M", str(DEFAULT_PQ_SUBVECTORS)))
+    # PQ needs the dimension to split evenly into subvectors of a few dims each
+    for m in range(min(target, max(1, dimension // 4)), 0, -1):
+        if dimension % m == 0:
+            return m
+    return 1
+
+def index_params(kind, count, dimension):
+    """
+    Build parameters for an index type, recorded in the store's metadata.
+    """
+    if kind == "hnsw":
+        return {"M": int(os.getenv("VECTOR_INDEX_HNSW_M", str(DEFAULT_HNSW_M))),
+                "ef_construction": DEFAULT_HNSW_EF_CONSTRUCTION,
+                "ef_search": int(os.getenv("VECTOR_SEARCH_EF", str(DEFAULT_HNSW_EF_SEARCH)))}
+    if kind in ("ivf", "ivfpq"):
+        nlist = _default_nlist(count)
+        params = {"nlist": nlist,
+                  "nprobe": int(os.getenv("VECTOR_SEARCH_NPROBE", "0")) or max(1, nlist // 16)}
+        if kind == "ivfpq":
+            params["pq_m"] = _pq_subvectors(dimension)
+        return params
+    return {}
+
+def _fits(kind, count, params):
+    # Too few points to train a useful quantizer: fall back to flat
+    if kind in ("ivf", "ivfpq") and count < params["nlist"] * MIN_POINTS_PER_CENTROID:
+        return False
+    if kind == "ivfpq" and count < PQ_CODES * MIN_POINTS_PER_CENTROID:
+        return False
+    return True
+
+def _training_sample(vectors, size, seed=0):
+    import numpy as np
+
+    count = len(vectors)
+    if count <= size:
+        return np.ascontiguousarray(vectors, dtype='float32')
+    rows = np.sort(np.random.default_rng(seed).choice(count, size=size, replace=False))
+    return np.ascontiguousarray(vectors[rows], dtype='float32')
+
+def resolve_index(count, dimension, kind=None):
+    """
+    The index type and build parameters build_index produces for `count`
+    vectors, after falling back to flat when a quantizer can't be trained.
+    """
+    kind = choose_index_type(count, kind)
+    params = index_params(kind, count, dimension)
+    if not _fits(kind, count, params):
+        return "flat", {}
+    return kind, params
+
+def add_rows(index, vectors, rows=None, block_size=65536):
+    """
+    Adds vectors (all of them, or the given sorted rows) to an index in
+    blocks, so a memory-mapped matrix is never read in at once.
+    """
+    import numpy as np
+
+    if rows is None:
+        for start in range(0, len(vectors), block_size):
+            index.add(np.ascontiguousarray(vectors[start:start + block_size], dtype='float32'))
+        return
+    for start in range(0, len(rows), block_size):
+        index.add(np.ascontiguousarray(vectors[rows[start:start + block_size]], dtype='float32'))
+
+def build_index(vectors, kind=None, block_size=65536):
+    """
+    Builds a FAISS index over a (possibly memory-mapped) float32 matrix whose
+    row i becomes vector ID i. Quantized indexes are trained on a random
+    sample. Returns (index, kind, params).
+    """
+    import faiss
+
+    count, dimension = vectors.shape
+    requested = choose_index_type(count, kind)
+    kind, params = resolve_index(count, dimension, requested)
+    if kind != requested:
+        print(f"Not enough vectors ({count}) to train a {requested} index. Using flat.")
+
+    if kind == "hnsw":
+        index = faiss.IndexHNSWFlat(dimension, params["M"])
+        index.hnsw.efConstruction = params["ef_construction"]
+        index.hnsw.efSearch = params["ef_search"]
+    elif kind == "ivf":
+        index = faiss.IndexIVFFlat(faiss.IndexFlatL2(dimension), dimension, params["nlist"])
+    elif kind == "ivfpq":
+        index = faiss.IndexIVFPQ(faiss.IndexFlatL2(dimension), dimension, params["nlist"], params["pq_m"], 8)
+    else:
+        index = faiss.IndexFlatL2(dimension)
+
+    if not index.is_trained:
+        sample_size = params["nlist"] * PQ_CODES
+        if kind == "ivfpq":
+            sample_size = max(sample_size, PQ_CODES * MIN_POINTS_PER_CENTROID)
+        sample_size = min(MAX_TRAINING_POINTS, sample_size)
+        index.train(_training_sample(vectors, sample_size))
+    if kind in ("ivf", "ivfpq"):
+        index.nprobe = params["nprobe"]
+
+    add_rows(index, vectors, block_size=block_size)
+    return index, kind, params
+
+def read_flags(kind):
+    """
+    mmap flags for reading an index of this type back from disk.
+    """
+    import faiss
+
+    if kind in ("ivf", "ivfpq"):
+        return faiss.IO_FLAG_MMAP
+    return faiss.IO_FLAG_MMAP_IFC
+
+def search_parameters(kind, nprobe=None, ef_search=None, selector=None):
+    """
+    Per-query search parameters overriding the values stored in the index,
+    or None to use the stored ones. selector (a faiss.IDSelector) limits the
+    search to those IDs; a parameter object always carries its own nprobe
+    or efSearch, so pass the stored values along with a selector.
+    """
+    import faiss
+
+    if kind in ("ivf", "ivfpq") and (nprobe or selector is not None):
+        params = faiss.SearchParametersIVF(sel=selector)
+        if nprobe:
+            params.nprobe = int(nprobe)
+        return params
+    if kind == "hnsw" and (ef_search or selector is not None):
+        params = faiss.SearchParametersHNSW(sel=selector)
+        if ef_search:
+            params.efSearch = int(ef_search)
+        return params
+    if selector is not None:
+        return faiss.SearchParameters(sel=selector)
+    return None
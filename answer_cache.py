@@ -0,0 +1,251 @@
+import os
+import re
+import asyncio
+import threading
+from collections import OrderedDict
+
+DEFAULT_MAX_ENTRIES = 1024
+# Cosine similarity above which two questions count as the same question
+DEFAULT_SEMANTIC_THRESHOLD = 0.92
+DEFAULT_SEMANTIC_ENTRIES = 256
+# Nearest cached queries checked for matching evidence
+SEMANTIC_CANDIDATES = 8
+
+_TRAILING_PUNCTUATION = re.compile(r"[\s?!.]+$")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_question(question):
+    """
+    Folds case, whitespace and trailing punctuation so trivially different
+    phrasings of the same question share an entry.
+    """
+    question = _WHITESPACE.sub(" ", question.strip().lower())
+    return _TRAILING_PUNCTUATION.sub("", question)
+
+
+class AnswerCache:
+    """
+    LRU of generated answers keyed by (index version, question, settings).
+    Concurrent misses for the same key share one computation.
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self._inflight_async = {}
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, version, question, *settings):
+        return (version, normalize_question(question)) + settings
+
+    def get(self, key):
+        with self._lock:
+            answer = self._entries.get(key)
+            if answer is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+            return answer
+
+    def put(self, key, answer):
+        if not self.max_entries:
+            return
+        with self._lock:
+            self._entries[key] = answer
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _store(self, key, answer):
+        # Failed answers (rate limits, API errors) are never cached
+        if not answer.get("error"):
+            self.put(key, answer)
+
+    def get_or_compute(self, key, compute):
+        """
+        Returns the cached answer for key, or computes it once; threads
+        asking for the same key meanwhile wait for that result.
+        """
+        answer = self.get(key)
+        if answer is not None:
+            return answer
+        with self._lock:
+            pending = self._inflight.get(key)
+            leader = pending is None
+            if leader:
+                pending = self._inflight[key] = [threading.Event(), None]
+        if not leader:
+            pending[0].wait()
+            if pending[1] is not None:
+                return pending[1]
+            return compute()
+        self.misses += 1
+        try:
+            answer = compute()
+            pending[1] = answer
+            self._store(key, answer)
+            return answer
+        finally:
+            with self._lock:
+                del self._inflight[key]
+            pending[0].set()
+
+    async def get_or_compute_async(self, key, compute):
+        """
+        Async get_or_compute: compute is a coroutine function, and concurrent
+        requests for the same key await a single task.
+        """
+        answer = self.get(key)
+        if answer is not None:
+            return answer
+        task = self._inflight_async.get(key)
+        if task is None:
+            self.misses += 1
+            task = asyncio.ensure_future(compute())
+            self._inflight_async[key] = task
+
+            def done(finished):
+                self._inflight_async.pop(key, None)
+                if not finished.cancelled() and finished.exception() is None:
+                    self._store(key, finished.result())
+
+            task.add_done_callback(done)
+        # Shielded so one caller disconnecting doesn't cancel the others
+        return await asyncio.shield(task)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {"entries": len(self._entries), "max_entries": self.max_entries,
+                    "hits": self.hits, "misses": self.misses,
+                    "hit_rate": self.hits / lookups if lookups else 0.0}
+
+
+class SemanticCache:
+    """
+    Answers for recent query embeddings, searched by cosine similarity in a
+    small FAISS inner-product index. A cached answer is reused only if the
+    new query is within `threshold` of the cached one and retrieval returned
+    the same chunks, so the answer was grounded on identical evidence.
+    Entries are evicted least recently used past max_entries.
+    """
+
+    def __init__(self, threshold=DEFAULT_SEMANTIC_THRESHOLD, max_entries=DEFAULT_SEMANTIC_ENTRIES):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._index = None
+        self._entries = OrderedDict()
+        self._next_id = 0
+        self.version = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _normalize(vector):
+        import numpy as np
+
+        vector = np.asarray(vector, dtype='float32').reshape(1, -1)
+        norm = float(np.linalg.norm(vector))
+        return vector / norm if norm else vector
+
+    def _reset(self, version, dimension):
+        import faiss
+
+        self._index = faiss.IndexIDMap2(faiss.IndexFlatIP(dimension))
+        self._entries.clear()
+        self.version = version
+
+    def _usable(self, results):
+        return self.max_entries and results.get("query_embedding") is not None and results.get("ids")
+
+    def get(self, version, results):
+        """
+        Returns the cached answer text for a retrieval, or None.
+        """
+        if not self._usable(results):
+            return None
+        vector = self._normalize(results["query_embedding"])
+        chunk_ids = frozenset(results["ids"][0])
+        with self._lock:
+            if self._index is None or self.version != version or self._index.d != vector.shape[1]:
+                self.misses += 1
+                return None
+            if self._index.ntotal:
+                scores, entry_ids = self._index.search(vector, min(SEMANTIC_CANDIDATES, self._index.ntotal))
+                for score, entry_id in zip(scores[0], entry_ids[0]):
+                    if entry_id == -1 or score < self.threshold:
+                        break
+                    entry = self._entries.get(int(entry_id))
+                    if entry is not None and entry[1] == chunk_ids:
+                        self._entries.move_to_end(int(entry_id))
+                        self.hits += 1
+                        return entry[0]
+            self.misses += 1
+            return None
+
+    def put(self, version, results, response):
+        import numpy as np
+
+        if not self._usable(results):
+            return
+        vector = self._normalize(results["query_embedding"])
+        with self._lock:
+            # A new index version or embedder makes every entry stale
+            if self._index is None or self.version != version or self._index.d != vector.shape[1]:
+                self._reset(version, vector.shape[1])
+            entry_id = self._next_id
+            self._next_id += 1
+            self._index.add_with_ids(vector, np.array([entry_id], dtype='int64'))
+            self._entries[entry_id] = (response, frozenset(results["ids"][0]))
+            while len(self._entries) > self.max_entries:
+                evicted, _ = self._entries.popitem(last=False)
+                self._index.remove_ids(np.array([evicted], dtype='int64'))
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._index = None
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {"entries": len(self._entries), "max_entries": self.max_entries,
+                    "threshold": self.threshold, "eviction": "lru",
+                    "hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                    "hit_rate": self.hits / lookups if lookups else 0.0}
+
+
+_answer_cache = None
+_semantic_cache = None
+
+def get_answer_cache():
+    """
+    Returns the process-wide answer cache (ANSWER_CACHE_SIZE entries, 0 disables).
+    """
+    global _answer_cache
+    if _answer_cache is None:
+        _answer_cache = AnswerCache(int(os.getenv("ANSWER_CACHE_SIZE", str(DEFAULT_MAX_ENTRIES))))
+    return _answer_cache
+
+def get_semantic_cache():
+    """
+    Returns the process-wide semantic cache, tuned by SEMANTIC_CACHE_THRESHOLD
+    and SEMANTIC_CACHE_SIZE (0 disables it).
+    """
+    global _semantic_cache
+    if _semantic_cache is None:
+        _semantic_cache = SemanticCache(
+            float(os.getenv("SEMANTIC_CACHE_THRESHOLD", str(DEFAULT_SEMANTIC_THRESHOLD))),
+            int(os.getenv("SEMANTIC_CACHE_SIZE", str(DEFAULT_SEMANTIC_ENTRIES))),
+        )
+    return _semantic_cache
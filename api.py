@@ -1,16 +1,78 @@
-from fastapi import FastAPI, HTTPException, UploadFile, File, BackgroundTasks
+from fastapi import FastAPI, HTTPException, UploadFile, File, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, StreamingResponse, Response, JSONResponse
 from pydantic import BaseModel
 import rag_chat
-from ingest import ingest_evidence
-from vector_store import build_vector_store, blind_search
+from timeline import extract_timeline_async
+from ingest import iter_evidence
+from case_catalog import refresh_catalog, update_file, update_files, list_cases, files_for_case, corpus_version
+from vector_store import build_vector_store, reload_store, warm_store, get_index_version
+from answer_cache import AnswerCache, get_answer_cache, get_semantic_cache
+from reindex_queue import ReindexQueue, count_evidence_files
+from bulk_upload import UploadRejected, safe_evidence_name, save_stream, iter_uploads
+from typing import List, Optional
+from contextlib import asynccontextmanager
+from metrics import HTTP_SECONDS, render_metrics, server_timing_header, span, start_request_timing
+import time
 import os
-import shutil
+import json
+import asyncio
+import hashlib
+import threading
 
+# Load and warm the index in the background at startup (PRELOAD_INDEX=0 to skip)
+PRELOAD_INDEX = os.getenv("PRELOAD_INDEX", "1").lower() not in ("0", "false", "no")
+# First wait before retrying a failed warm-up; doubles up to the maximum
+WARM_UP_RETRY_SECONDS = float(os.getenv("WARM_UP_RETRY_SECONDS", "15"))
+WARM_UP_RETRY_MAX_SECONDS = 300
 
-app = FastAPI()
+_warm_up = {"state": "pending", "seconds": None, "error": None, "attempts": 0}
+
+def warm_up():
+    """
+    Loads the index, pages it in with a throwaway search, readies the query
+    embedder and builds the case catalog, so the first requests don't pay
+    for any of it. With evidence on disk but no store yet, it queues an
+    index build. Returns False if it failed; /ready reports the outcome.
+    """
+    _warm_up["state"] = "running"
+    _warm_up["attempts"] += 1
+    start = time.perf_counter()
+    try:
+        with span("warm_up"):
+            store = warm_store()
+            list_cases()
+        _warm_up["state"] = "done" if store is not None else "no_index"
+        if store is None and count_evidence_files():
+            print("No vector store found. Queueing an index build.")
+            reindex_queue.request()
+        print(f"Warm-up finished in {time.perf_counter() - start:.2f}s.")
+        _warm_up["error"] = None
+    except Exception as e:
+        print(f"Warm-up failed: {e}")
+        _warm_up.update(state="failed", error=str(e))
+    _warm_up["seconds"] = round(time.perf_counter() - start, 3)
+    return _warm_up["state"] != "failed"
+
+def _warm_up_until_done():
+    # A failed warm-up (e.g. a store still being written) is retried with backoff
+    delay = WARM_UP_RETRY_SECONDS
+    while not warm_up():
+        print(f"Retrying warm-up in {delay:g}s.")
+        time.sleep(delay)
+        delay = min(delay * 2, WARM_UP_RETRY_MAX_SECONDS)
+
+@asynccontextmanager
+async def lifespan(app):
+    # The server accepts connections right away; /ready says when it's warm
+    if PRELOAD_INDEX:
+        threading.Thread(target=_warm_up_until_done, name="warm-up", daemon=True).start()
+    else:
+        _warm_up["state"] = "skipped"
+    yield
+
+app = FastAPI(lifespan=lifespan)
 
 # Ensure evidence directory exists
 if not os.path.exists("evidence"):
@@ -30,8 +92,52 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Per-stage Server-Timing headers on every response, for debugging slow requests
+TIMING_HEADERS = os.getenv("TIMING_HEADERS", "").lower() in ("1", "true", "yes")
+
+@app.middleware("http")
+async def record_timings(request, call_next):
+    timings = start_request_timing()
+    start = time.perf_counter()
+    response = await call_next(request)
+    elapsed = time.perf_counter() - start
+    # Route templates, not raw paths, keep label cardinality bounded
+    route = request.scope.get("route")
+    path = getattr(route, "path", "unmatched")
+    HTTP_SECONDS.observe(elapsed, method=request.method, path=path, status=response.status_code)
+    if TIMING_HEADERS:
+        timings["total"] = elapsed
+        response.headers["Server-Timing"] = server_timing_header(timings)
+    return response
+
+# Serialized /cases, /trace and /timeline responses, keyed by corpus version and parameters
+_responses = AnswerCache(int(os.getenv("RESPONSE_CACHE_SIZE", "256")))
+
+def _response_entry(body, complete=True):
+    """
+    Serializes a response once, with its ETag. Incomplete results carry
+    "error", which AnswerCache never stores, so they are recomputed.
+    """
+    payload = json.dumps(body).encode("utf-8")
+    return {"payload": payload, "etag": f'"{hashlib.sha256(payload).hexdigest()[:32]}"', "error": not complete}
+
+def _etag_matches(header, etag):
+    if not header:
+        return False
+    tags = [tag.strip() for tag in header.split(",")]
+    return "*" in tags or etag in tags or f"W/{etag}" in tags
+
+def _conditional_response(request, entry):
+    # no-cache: browsers keep the body but revalidate every time, getting a 304 if unchanged
+    headers = {"ETag": entry["etag"], "Cache-Control": "no-cache"}
+    if _etag_matches(request.headers.get("if-none-match"), entry["etag"]):
+        return Response(status_code=304, headers=headers)
+    return Response(entry["payload"], media_type="application/json", headers=headers)
+
 class ChatRequest(BaseModel):
     message: str
+    # Limits retrieval to one case's evidence; None or "All" searches every case
+    case_id: Optional[str] = None
 
 class ChatResponse(BaseModel):
     response: str
@@ -45,100 +151,198 @@ def read_root():
 def health_check():
     return {"status": "healthy", "api_key_set": bool(os.getenv("GOOGLE_API_KEY"))}
 
+@app.get("/ready")
+def readiness_check():
+    """
+    Readiness probe: 200 once the vector index is loaded, 503 until then.
+    Unlike /health, a freshly started instance isn't ready while warming up,
+    nor while the index build queued at warm-up runs ("building"), since
+    every answer would come back without evidence. With no evidence files
+    there is nothing to wait for, so "no_index" is ready; evidence without
+    an index and no build under way is "index_missing". With PRELOAD_INDEX=0
+    it is ready at once and the first query loads the index. A failed
+    warm-up is 503 until a retry succeeds.
+    """
+    version = get_index_version()
+    state = _warm_up["state"]
+    indexer = reindex_queue.status()["state"]
+    if version is not None and state != "running":
+        status = "ready"
+    elif state == "no_index":
+        if indexer in ("queued", "running"):
+            status = "building"
+        elif count_evidence_files():
+            status = "index_missing"
+        else:
+            status = "no_index"
+    elif state in ("failed", "skipped"):
+        status = state
+    else:
+        status = "starting"
+    return JSONResponse(
+        status_code=200 if status in ("ready", "no_index", "skipped") else 503,
+        content={"status": status, "index_version": version, "index_loaded": version is not None,
+                 "indexer": indexer, "warm_up": _warm_up},
+    )
+
+@app.get("/metrics")
+def metrics_endpoint():
+    """
+    Prometheus scrape endpoint: stage latency histograms, retry and
+    rate-limit counters, prompt sizes and index gauges.
+    """
+    return Response(render_metrics(), media_type="text/plain; version=0.0.4")
+
+@app.get("/cache/stats")
+def cache_stats():
+    # Hit rates and limits of the exact and semantic answer caches
+    return {"answers": get_answer_cache().stats(), "semantic": get_semantic_cache().stats(),
+            "responses": _responses.stats()}
+
 @app.post("/ingest")
-async def ingest_endpoint(background_tasks: BackgroundTasks):
+async def ingest_endpoint():
     try:
         print("Manual ingest requested.")
-        background_tasks.add_task(reindex_task)
-        return {"status": "success", "message": "Manual re-indexing started in the background."}
+        job = reindex_queue.request()
+        return {"status": "success", "message": "Manual re-indexing started in the background.", "job": job}
     except Exception as e:
         print(f"Ingest endpoint error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
 
+@app.get("/ingest/status")
+def ingest_status():
+    """
+    Progress of the background indexer, for the frontend to poll.
+    """
+    return reindex_queue.status()
+
 @app.post("/upload")
-async def upload_file(background_tasks: BackgroundTasks, file: UploadFile = File(...)):
-    if not file.filename.endswith(".txt"):
-         raise HTTPException(status_code=400, detail="Only .txt files are allowed")
+def upload_file(file: UploadFile = File(...)):
+    try:
+        filename = safe_evidence_name(file.filename)
+    except UploadRejected as e:
+         raise HTTPException(status_code=400, detail=f"{file.filename}: {e}")
     
-    file_location = os.path.join("evidence", file.filename)
     try:
-        with open(file_location, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        save_stream(file.file, filename)
+        update_file(filename)
         
-        # Move indexing to background to avoid timeout
-        background_tasks.add_task(reindex_task)
+        # Indexing runs on the background worker; uploads in quick
+        # succession share one rebuild
+        job = reindex_queue.request()
         
-        return {"status": "success", "message": f"File '{file.filename}' uploaded. Indexing in progress..."}
+        return {"status": "success", "message": f"File '{filename}' uploaded. Indexing in progress...", "job": job}
+    except UploadRejected as e:
+        raise HTTPException(status_code=400, detail=f"{filename}: {e}")
     except Exception as e:
         import traceback
         error_details = traceback.format_exc()
         print(f"Upload error: {error_details}")
         raise HTTPException(status_code=500, detail=str(e))
 
-def reindex_task():
+@app.post("/upload/bulk")
+def upload_bulk(files: List[UploadFile] = File(...)):
+    """
+    Accepts many .txt files and/or zip/tar archives of them in one request.
+    Files are streamed to evidence/ one block at a time, then a single
+    indexing pass is queued. Returns what happened to every file. Files
+    saved before an unexpected error are still catalogued and indexed.
+    """
+    summary = []
+    error = None
     try:
-        print("Starting background re-indexing...")
-        data = ingest_evidence("evidence")
-        if not data:
-            print("No evidence found to index. Skipping vector store build.")
-            return
-        build_vector_store(data)
-        print(f"Background re-indexing complete. Processed {len(data)} chunks.")
+        for entry in iter_uploads((upload.filename, upload.file) for upload in files):
+            summary.append(entry)
     except Exception as e:
         import traceback
-        print(f"CRITICAL: Background re-indexing failed: {e}")
-        print(traceback.format_exc())
+        print(f"Bulk upload error: {traceback.format_exc()}")
+        error = str(e)
+    saved = [entry["name"] for entry in summary if entry["status"] == "saved"]
+    if saved:
+        update_files(saved)
+    if error and not saved:
+        raise HTTPException(status_code=500, detail=error)
+    job = reindex_queue.request() if saved else reindex_queue.status()
+    message = f"{len(saved)} of {len(summary)} files saved." + (" Indexing in progress..." if saved else "")
+    if error:
+        message += f" Upload stopped early: {error}"
+    return {
+        "status": ("partial" if error else "success") if saved else "nothing_saved",
+        "message": message,
+        "files": summary,
+        "job": job,
+    }
+
+def reindex_task(progress=None):
+    """
+    One indexing run. Only the reindex queue's worker calls this, so runs
+    never overlap; failures propagate to the queue's status.
+    """
+    print("Starting background re-indexing...")
+    refresh_catalog("evidence")
+    # Chunks stream straight from disk into embedding batches; the new
+    # generation is written to a temp directory and published atomically
+    with span("reindex"):
+        report = build_vector_store(iter_evidence("evidence"), progress=progress)
+    if not report:
+        print("No evidence indexed. Vector store left unchanged.")
+        return None
+    # Swap the new index in now so the next query doesn't pay for the load
+    reload_store()
+    # Keys carry the index version, so old answers are unreachable anyway
+    get_answer_cache().clear()
+    get_semantic_cache().clear()
+    _responses.clear()
+    print(f"Background re-indexing complete. Embedded {report['embedded_chunks']} of {report['total_chunks']} chunks.")
+    return report
+
+reindex_queue = ReindexQueue(
+    reindex_task,
+    debounce=float(os.getenv("REINDEX_DEBOUNCE_SECONDS", "2")),
+    expected_files=count_evidence_files,
+)
 
 
 
+# Plain def: the first call may build the catalog from disk, so keep it off the event loop
 @app.get("/cases")
-async def get_cases():
-    evidence_dir = "evidence"
-    if not os.path.exists(evidence_dir):
-        return {"cases": []}
-    
-    cases = set()
-    for filename in os.listdir(evidence_dir):
-        if filename.endswith(".txt"):
-            file_path = os.path.join(evidence_dir, filename)
-            try:
-                # Use errors='replace' to avoid crashing on encoding issues
-                with open(file_path, 'r', encoding='utf-8', errors='replace') as f:
-                    first_line = f.readline().strip()
-                    if ":" in first_line and (first_line.startswith("Case ID:") or first_line.startswith("Case:")):
-                        cases.add(first_line.split(":")[1].strip())
-                    else:
-                        cases.add("Uncategorized")
-            except Exception as e:
-                print(f"Error reading case file {filename}: {e}")
-                cases.add("Uncategorized")
-    
-    return {"cases": sorted(list(cases))}
+def get_cases(request: Request):
+    # Served from the in-memory case catalog; no evidence files are read here
+    key = _responses.key(corpus_version(), "/cases")
+    entry = _responses.get_or_compute(key, lambda: _response_entry({"cases": list_cases()}))
+    return _conditional_response(request, entry)
 
 @app.get("/timeline")
-async def get_timeline(case_id: str = None):
+async def get_timeline(request: Request, case_id: str = None):
+    """
+    Chronological timeline for a case, memoized per corpus version. Only a
+    change to the evidence (upload or reindex) costs Gemini calls again.
+    """
+    async def compute():
+        # Per-file results are cached, so filtering by case only costs
+        # calls for that case's uncached files
+        timeline, failed = await extract_timeline_async(case_id, with_failures=True)
+        return _response_entry({"timeline": timeline}, complete=not failed)
+
     try:
-        # If case_id is provided, filter or pass it to extraction logic
-        # For now, we return the full timeline or a filtered one
-        timeline = rag_chat.extract_timeline()
-        if case_id and case_id != "All":
-             # Optional: filter timeline by case_id if possible
-             pass
-        return {"timeline": timeline}
+        key = _responses.key(await asyncio.to_thread(corpus_version), "/timeline", case_id)
+        entry = await _responses.get_or_compute_async(key, compute)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    return _conditional_response(request, entry)
 
 @app.get("/trace")
-async def get_trace(case_id: str = "All"):
+def get_trace(request: Request, case_id: str = "All"):
     """
     Generates a network graph (nodes/links) for the selected case.
     """
-    evidence_dir = "evidence"
-    if not os.path.exists(evidence_dir):
-        return {"nodes": [], "links": []}
+    key = _responses.key(corpus_version(), "/trace", case_id)
+    entry = _responses.get_or_compute(key, lambda: _response_entry(build_trace(case_id)))
+    return _conditional_response(request, entry)
 
+def build_trace(case_id):
     nodes = []
     links = []
     
@@ -146,71 +350,39 @@ async def get_trace(case_id: str = "All"):
     root_id = "CASE_ROOT"
     nodes.append({"id": root_id, "label": case_id if case_id != "All" else "Master Archive", "type": "root"})
 
-    files_processed = 0
-
-    for filename in os.listdir(evidence_dir):
-        if not filename.endswith(".txt"):
-            continue
-            
-        file_path = os.path.join(evidence_dir, filename)
-        try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-                
-                # Check if file belongs to case
-                is_relevant = False
-                if case_id == "All":
-                    is_relevant = True
-                elif f"Case: {case_id}" in content or f"Case ID: {case_id}" in content:
-                    is_relevant = True
-                # Fallback: if filename contains case name (simplified)
-                elif case_id.lower().split()[0] in filename.lower(): 
-                   is_relevant = True
-                
-                if is_relevant:
-                    file_node_id = f"FILE_{filename}"
-                    nodes.append({"id": file_node_id, "label": filename, "type": "file"})
-                    links.append({"source": root_id, "target": file_node_id})
-                    
-                    # Extract simple entities (Capitalized words - naive NER)
-                    # This adds "flavor" to the graph without complex NLP
-                    words = set()
-                    for word in content.split():
-                        if word and word[0].isupper() and len(word) > 4:
-
-                            clean_word = word.strip(".,:;\"'")
-                            if clean_word not in ["Case", "Date", "Time", "Report", "Evidence"]:
-                                words.add(clean_word)
-                    
-                    # Limit to 3 key entities per file to avoid clutter
-                    for i, entity in enumerate(list(words)[:3]):
-                        entity_id = f"ENT_{entity}_{filename}"
-                        nodes.append({"id": entity_id, "label": entity, "type": "entity"})
-                        links.append({"source": file_node_id, "target": entity_id})
-                        
-        except Exception as e:
-            print(f"Error reading {filename}: {e}")
-            continue
+    # Case membership and entities come from the catalog built at ingest time
+    for filename, entry in files_for_case(case_id):
+        file_node_id = f"FILE_{filename}"
+        nodes.append({"id": file_node_id, "label": filename, "type": "file"})
+        links.append({"source": root_id, "target": file_node_id})
+        
+        # Limit to 3 key entities per file to avoid clutter
+        for entity in entry["entities"][:3]:
+            entity_id = f"ENT_{entity}_{filename}"
+            nodes.append({"id": entity_id, "label": entity, "type": "entity"})
+            links.append({"source": file_node_id, "target": entity_id})
 
     return {"nodes": nodes, "links": links}
 
+def format_sources(results):
+    sources = []
+    for doc, meta in zip(results['documents'][0], results['metadatas'][0]):
+        sources.append({
+            "source": meta['source'],
+            "content": doc
+        })
+    return sources
+
 @app.post("/chat", response_model=ChatResponse)
 async def chat_endpoint(request: ChatRequest):
     try:
-        # Get response using the logic in rag_chat.py
-        response_text = rag_chat.generate_response(request.message)
+        # Answer and sources come from the same single retrieval
+        answer = await rag_chat.answer_question_async(request.message, case_id=request.case_id)
+        response_text = answer["response"]
+        results = answer["results"]
         
-        # Determine if it's an error message or a real response
-        # If it's an error, we still want to show it in the chat
-        
-        # Get raw sources for the Case Board
-        results = blind_search(request.message, n_results=3)
-        sources = []
-        for doc, meta in zip(results['documents'][0], results['metadatas'][0]):
-            sources.append({
-                "source": meta['source'],
-                "content": doc
-            })
+        # Raw sources for the Case Board
+        sources = format_sources(results)
             
         return ChatResponse(response=response_text, sources=sources)
     except Exception as e:
@@ -220,6 +392,28 @@ async def chat_endpoint(request: ChatRequest):
             sources=[]
         )
 
+@app.post("/chat/stream")
+async def chat_stream_endpoint(request: ChatRequest):
+    """
+    Server-Sent Events version of /chat: a "sources" event right after
+    retrieval, "token" events as Gemini generates, and a final "done" event
+    with the full response and its citations.
+    """
+    async def event_stream():
+        try:
+            async for event, payload in rag_chat.stream_answer(request.message, case_id=request.case_id):
+                if event == "sources":
+                    payload = format_sources(payload)
+                yield f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+        except Exception as e:
+            yield f"event: error\ndata: {json.dumps({'message': f'SYSTEM ERROR: {str(e)}'})}\n\n"
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 # Serve Static Files (Frontend)
 frontend_path = os.path.join(os.path.dirname(__file__), "frontend", "dist")
 if os.path.exists(frontend_path):
@@ -0,0 +1,116 @@
+"""
+Recall / latency benchmark for the ANN index types in ann_index.
+
+Measures recall@k against an exact flat index and p50/p99 single-query
+search latency for each index type across a sweep of nprobe / efSearch.
+
+    python -m benchmarks.ann_benchmark --count 200000 --dim 768
+    python -m benchmarks.ann_benchmark --store vector_store --json ann.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ann_index import build_index, search_parameters
+
+NPROBE_SWEEP = (1, 4, 16, 64)
+EF_SEARCH_SWEEP = (16, 64, 256)
+
+
+def synthetic_vectors(count, dim, seed=0):
+    """
+    Clustered Gaussian data; uniform noise makes every index look the same.
+    """
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((max(1, count // 1000), dim)).astype('float32')
+    labels = rng.integers(0, len(centers), size=count)
+    return (centers[labels] + 0.3 * rng.standard_normal((count, dim))).astype('float32')
+
+def store_vectors(store_path):
+    from store_format import StoreGeneration, current_generation_path
+
+    path = current_generation_path(store_path)
+    if path is None:
+        raise SystemExit(f"No published store at {store_path}")
+    generation = StoreGeneration(path)
+    if generation.vectors is None:
+        raise SystemExit("This store generation has no vectors.f32; rebuild it first.")
+    return generation.vectors
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q / 100 * len(ordered)))]
+
+def run_config(index, kind, queries, truth, k, nprobe=None, ef_search=None):
+    params = search_parameters(kind, nprobe=nprobe, ef_search=ef_search)
+    latencies = []
+    hits = 0
+    for i in range(len(queries)):
+        start = time.perf_counter()
+        _, found = index.search(queries[i:i + 1], k, params=params)
+        latencies.append((time.perf_counter() - start) * 1000)
+        hits += len(set(found[0].tolist()) & set(truth[i].tolist()))
+    return {
+        "index_type": kind,
+        "nprobe": nprobe,
+        "ef_search": ef_search,
+        "recall_at_k": hits / (len(queries) * k),
+        "p50_ms": percentile(latencies, 50),
+        "p99_ms": percentile(latencies, 99),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--count", type=int, default=100_000, help="synthetic corpus size")
+    parser.add_argument("--dim", type=int, default=768, help="synthetic vector dimension")
+    parser.add_argument("--store", help="benchmark the vectors of an existing store instead")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--types", default="flat,hnsw,ivf,ivfpq")
+    parser.add_argument("--json", help="also write results to this file")
+    args = parser.parse_args()
+
+    import numpy as np
+
+    vectors = store_vectors(args.store) if args.store else synthetic_vectors(args.count, args.dim)
+    rng = np.random.default_rng(1)
+    rows = rng.choice(len(vectors), size=min(args.queries, len(vectors)), replace=False)
+    queries = np.ascontiguousarray(vectors[rows], dtype='float32')
+    queries += 0.05 * rng.standard_normal(queries.shape).astype('float32')
+
+    exact, _, _ = build_index(vectors, "flat")
+    _, truth = exact.search(queries, args.k)
+
+    results = []
+    for kind in args.types.split(","):
+        start = time.perf_counter()
+        index, built, params = build_index(vectors, kind)
+        build_s = time.perf_counter() - start
+        if built in ("ivf", "ivfpq"):
+            sweep = [{"nprobe": n} for n in NPROBE_SWEEP if n <= params["nlist"]]
+        elif built == "hnsw":
+            sweep = [{"ef_search": ef} for ef in EF_SEARCH_SWEEP]
+        else:
+            sweep = [{}]
+        for setting in sweep:
+            result = run_config(index, built, queries, truth, args.k, **setting)
+            result["build_s"] = build_s
+            result["params"] = params
+            results.append(result)
+            print(f"{built:6} nprobe={str(result['nprobe']):>4} ef={str(result['ef_search']):>4}  "
+                  f"recall@{args.k}={result['recall_at_k']:.3f}  "
+                  f"p50={result['p50_ms']:.3f}ms  p99={result['p99_ms']:.3f}ms  build={build_s:.1f}s")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"count": len(vectors), "dim": int(vectors.shape[1]), "k": args.k,
+                       "results": results}, f, indent=2)
+
+if __name__ == "__main__":
+    main()
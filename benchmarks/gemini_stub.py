@@ -0,0 +1,112 @@
+"""
+Deterministic stand-in for google.genai.Client, for offline benchmarks.
+
+Embeddings are pseudo-random unit vectors seeded by the text, so the same
+text always gets the same vector; generation returns canned answers that
+cite the first source in the prompt, and timeline prompts get a small JSON
+event list. An optional per-call latency mimics network round trips.
+"""
+import re
+import time
+import asyncio
+import hashlib
+import threading
+from types import SimpleNamespace
+
+DEFAULT_DIMENSION = 768
+
+_SOURCE = re.compile(r"(?:SOURCE|Source): (\S+)")
+
+
+class _Counters:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.embed_calls = 0
+        self.embedded_texts = 0
+        self.generate_calls = 0
+
+    def embed(self, count):
+        with self._lock:
+            self.embed_calls += 1
+            self.embedded_texts += count
+
+    def generate(self):
+        with self._lock:
+            self.generate_calls += 1
+
+    def as_dict(self):
+        return {"embed_calls": self.embed_calls, "embedded_texts": self.embedded_texts,
+                "generate_calls": self.generate_calls}
+
+
+class _Models:
+    def __init__(self, dimension, latency, counters):
+        self.dimension = dimension
+        self.latency = latency
+        self.counters = counters
+
+    def vector(self, text):
+        import numpy as np
+
+        seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+        vector = np.random.default_rng(seed).standard_normal(self.dimension).astype("float32")
+        return vector / np.linalg.norm(vector)
+
+    def embed(self, contents):
+        if isinstance(contents, str):
+            contents = [contents]
+        self.counters.embed(len(contents))
+        return SimpleNamespace(embeddings=[SimpleNamespace(values=self.vector(text).tolist()) for text in contents])
+
+    def embed_content(self, model, contents, config=None):
+        if self.latency:
+            time.sleep(self.latency)
+        return self.embed(contents)
+
+    def answer(self, contents):
+        sources = _SOURCE.findall(contents)
+        source = sources[0] if sources else "unknown.txt"
+        if "chronological timeline" in contents:
+            return ('[{"time": "2023-10-14 21:00", "event": "Vehicle seen leaving", "source": "%s"}]' % source)
+        return f"The evidence points to the silver sedan [{source}]."
+
+    def generate_content(self, model, contents, config=None):
+        if self.latency:
+            time.sleep(self.latency)
+        self.counters.generate()
+        return SimpleNamespace(text=self.answer(contents))
+
+
+class _AsyncModels:
+    def __init__(self, models):
+        self.models = models
+
+    async def embed_content(self, model, contents, config=None):
+        if self.models.latency:
+            await asyncio.sleep(self.models.latency)
+        return self.models.embed(contents)
+
+    async def generate_content(self, model, contents, config=None):
+        if self.models.latency:
+            await asyncio.sleep(self.models.latency)
+        self.models.counters.generate()
+        return SimpleNamespace(text=self.models.answer(contents))
+
+    async def generate_content_stream(self, model, contents, config=None):
+        text = await self.generate_content(model, contents)
+
+        async def chunks():
+            for word in text.text.split(" "):
+                yield SimpleNamespace(text=word + " ")
+        return chunks()
+
+
+class StubClient:
+    """
+    Drop-in for the parts of google.genai.Client the app uses.
+    """
+
+    def __init__(self, dimension=DEFAULT_DIMENSION, latency_ms=0.0):
+        self.counters = _Counters()
+        self.models = _Models(dimension, latency_ms / 1000.0, self.counters)
+        self.aio = SimpleNamespace(models=_AsyncModels(self.models))
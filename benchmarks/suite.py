@@ -0,0 +1,273 @@
+"""
+Offline benchmark suite for ingest, index builds, search and the API.
+
+For each corpus size it generates synthetic evidence, swaps the Gemini
+client for the deterministic stub in benchmarks.gemini_stub, and measures:
+
+    ingest   chunks/s and MB/s of ingest.ingest_evidence
+    build    wall time, peak RSS and on-disk size of build_vector_store
+    search   p50/p99 latency of blind_search
+    api      cold latency, p50/p99 and requests/s of /chat, /cases,
+             /trace and /timeline through the FastAPI app
+
+Each size runs in its own process and temp directory, so module-level
+caches and peak RSS don't leak between sizes.
+
+    python -m benchmarks.suite --sizes 1000,10000,100000 --json bench.json
+    python -m benchmarks.suite --sizes 1000000 --skip api --stub-latency-ms 50
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+DEFAULT_SIZES = "1000,10000,100000"
+STAGES = ("ingest", "build", "search", "api")
+
+WORDS = ("witness suspect vehicle sedan alley warehouse receipt footage badge officer "
+         "detective statement timeline forensic fingerprint camera parking street hoodie "
+         "window door glass blood sample report interview motive alibi night morning "
+         "victim neighbour phone call record license plate silver black red lot gate").split()
+NAMES = ("Sarah Miller", "John Doe", "Officer Reyes", "Dr. Patel", "Mark Chen", "Ana Silva",
+         "Det. Ward", "Lucy Grant")
+PLACES = ("Main Street", "Elm Alley", "Sector 7 Warehouse", "Harbor Lot", "Pine Motel")
+
+
+def synthetic_corpus(directory, chunks, chunks_per_file=20, cases=50, seed=0):
+    """
+    Writes enough evidence files to yield about `chunks` chunks. Returns
+    (files, bytes) written.
+    """
+    from ingest import CHUNK_SIZE, CHUNK_OVERLAP
+
+    rng = random.Random(seed)
+    step = CHUNK_SIZE - CHUNK_OVERLAP
+    os.makedirs(directory, exist_ok=True)
+    files = max(1, -(-chunks // chunks_per_file))
+    total = 0
+    for i in range(files):
+        per_file = min(chunks_per_file, chunks - i * chunks_per_file)
+        lines = [f"Case ID: CASE-{i % cases:04d}"]
+        length = len(lines[0]) + 1
+        while length < per_file * step:
+            line = (f"{rng.randint(0, 23):02d}:{rng.randint(0, 59):02d} - {rng.choice(NAMES)} "
+                    f"near {rng.choice(PLACES)}: " + " ".join(rng.choice(WORDS) for _ in range(rng.randint(6, 14))) + ".")
+            lines.append(line)
+            length += len(line) + 1
+        text = "\n".join(lines)[:per_file * step]
+        with open(os.path.join(directory, f"evidence_{i:06d}.txt"), "w", encoding="utf-8") as f:
+            f.write(text)
+        total += len(text.encode("utf-8"))
+    return files, total
+
+def sample_queries(count, seed=1):
+    rng = random.Random(seed)
+    return [f"What did {rng.choice(NAMES)} see near {rng.choice(PLACES)} about the "
+            f"{rng.choice(WORDS)} and {rng.choice(WORDS)}?" for _ in range(count)]
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q / 100 * len(ordered)))]
+
+def latency_summary(latencies_ms, wall_s):
+    return {"count": len(latencies_ms),
+            "p50_ms": percentile(latencies_ms, 50),
+            "p99_ms": percentile(latencies_ms, 99),
+            "per_second": len(latencies_ms) / wall_s if wall_s else None}
+
+def peak_rss_mb():
+    import resource
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def directory_size(path):
+    return sum(os.path.getsize(os.path.join(root, name))
+               for root, _, names in os.walk(path) for name in names)
+
+def bench_ingest(directory, corpus_bytes):
+    from ingest import ingest_evidence
+
+    start = time.perf_counter()
+    chunks = len(ingest_evidence(directory))
+    elapsed = time.perf_counter() - start
+    return {"chunks": chunks, "seconds": elapsed, "chunks_per_s": chunks / elapsed,
+            "mb_per_s": corpus_bytes / (1024 * 1024) / elapsed}
+
+def bench_build(directory, client):
+    from ingest import iter_evidence
+    from vector_store import build_vector_store, STORE_PATH
+
+    rss_before = peak_rss_mb()
+    start = time.perf_counter()
+    report = build_vector_store(iter_evidence(directory))
+    elapsed = time.perf_counter() - start
+    return {"seconds": elapsed, "chunks": report["total_chunks"],
+            "chunks_per_s": report["total_chunks"] / elapsed,
+            "index_type": report.get("index_type"),
+            "peak_rss_mb": peak_rss_mb(), "peak_rss_before_mb": rss_before,
+            "store_mb": directory_size(STORE_PATH) / (1024 * 1024),
+            "upstream": client.counters.as_dict()}
+
+def bench_search(queries, n_results):
+    from vector_store import blind_search, get_store
+
+    get_store()
+    blind_search(queries[0], n_results=n_results)
+    latencies = []
+    start = time.perf_counter()
+    for query in queries:
+        began = time.perf_counter()
+        blind_search(query, n_results=n_results)
+        latencies.append((time.perf_counter() - began) * 1000)
+    return dict(latency_summary(latencies, time.perf_counter() - start),
+                mode=os.getenv("SEARCH_MODE", "hybrid"))
+
+def bench_api(requests, client):
+    from fastapi.testclient import TestClient
+    import api
+
+    http = TestClient(api.app)
+    questions = sample_queries(requests + 1, seed=2)
+    calls = {
+        "/chat": lambda i: http.post("/chat", json={"message": questions[i]}),
+        "/cases": lambda i: http.get("/cases"),
+        "/trace": lambda i: http.get("/trace", params={"case_id": "CASE-0001"}),
+        "/timeline": lambda i: http.get("/timeline", params={"case_id": "CASE-0001"}),
+    }
+    results = {}
+    for endpoint, call in calls.items():
+        began = time.perf_counter()
+        response = call(0)
+        cold_ms = (time.perf_counter() - began) * 1000
+        if response.status_code != 200:
+            results[endpoint] = {"error": f"HTTP {response.status_code}: {response.text[:200]}"}
+            continue
+        latencies = []
+        start = time.perf_counter()
+        for i in range(1, requests + 1):
+            began = time.perf_counter()
+            call(i)
+            latencies.append((time.perf_counter() - began) * 1000)
+        results[endpoint] = dict(latency_summary(latencies, time.perf_counter() - start), cold_ms=cold_ms)
+    results["upstream"] = client.counters.as_dict()
+    return results
+
+def run_size(args):
+    """
+    Runs every stage for one corpus size inside a scratch directory.
+    """
+    from benchmarks.gemini_stub import StubClient
+    import embedders
+
+    client = StubClient(dimension=args.dim, latency_ms=args.stub_latency_ms)
+    embedders._client = client
+
+    result = {"size": args.run_size}
+    began = time.perf_counter()
+    files, corpus_bytes = synthetic_corpus("evidence", args.run_size, args.chunks_per_file)
+    result["corpus"] = {"files": files, "mb": corpus_bytes / (1024 * 1024),
+                        "generate_s": time.perf_counter() - began}
+
+    skip = set(args.skip.split(",")) if args.skip else set()
+    # Build first so its peak RSS isn't inflated by the in-memory ingest list
+    if "build" not in skip:
+        result["build"] = bench_build("evidence", client)
+    if "ingest" not in skip:
+        result["ingest"] = bench_ingest("evidence", corpus_bytes)
+    if "search" not in skip and "build" not in skip:
+        result["search"] = bench_search(sample_queries(args.queries), args.n_results)
+    if "api" not in skip and "build" not in skip:
+        result["api"] = bench_api(args.requests, client)
+    return result
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="comma-separated corpus sizes in chunks")
+    parser.add_argument("--chunks-per-file", type=int, default=20)
+    parser.add_argument("--dim", type=int, default=768, help="stub embedding dimension")
+    parser.add_argument("--stub-latency-ms", type=float, default=0.0, help="simulated Gemini round trip")
+    parser.add_argument("--queries", type=int, default=200, help="blind_search calls per size")
+    parser.add_argument("--n-results", type=int, default=3)
+    parser.add_argument("--requests", type=int, default=50, help="requests per API endpoint")
+    parser.add_argument("--skip", default="", help=f"stages to skip, from {','.join(STAGES)}")
+    parser.add_argument("--keep", action="store_true", help="keep the scratch directories")
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--run-size", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--result-file", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_size:
+        result = run_size(args)
+        with open(args.result_file, "w", encoding="utf-8") as f:
+            json.dump(result, f)
+        return
+
+    results = []
+    for size in [int(s) for s in args.sizes.split(",") if s]:
+        scratch = tempfile.mkdtemp(prefix=f"bench-{size}-")
+        result_file = os.path.join(scratch, "result.json")
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [ROOT, os.getenv("PYTHONPATH")])),
+                   GOOGLE_API_KEY="", EMBEDDING_CACHE_PATH=os.path.join(scratch, "embedding_cache.sqlite3"))
+        command = [sys.executable, "-m", "benchmarks.suite", "--run-size", str(size), "--result-file", result_file]
+        for flag in ("chunks_per_file", "dim", "stub_latency_ms", "queries", "n_results", "requests", "skip"):
+            command += [f"--{flag.replace('_', '-')}", str(getattr(args, flag))]
+        print(f"== {size} chunks ({scratch})")
+        began = time.perf_counter()
+        completed = subprocess.run(command, cwd=scratch, env=env, capture_output=True, text=True)
+        if completed.returncode != 0:
+            print(completed.stdout[-2000:], completed.stderr[-2000:])
+            results.append({"size": size, "error": completed.stderr.strip().splitlines()[-1:]})
+        else:
+            with open(result_file, encoding="utf-8") as f:
+                result = json.load(f)
+            result["wall_s"] = time.perf_counter() - began
+            results.append(result)
+            print_result(result)
+        if not args.keep:
+            shutil.rmtree(scratch, ignore_errors=True)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"revision": git_revision(), "python": platform.python_version(),
+                       "platform": platform.platform(), "settings": vars(args), "results": results}, f, indent=2)
+
+def print_result(result):
+    if "build" in result:
+        b = result["build"]
+        print(f"  build   {b['seconds']:.2f}s  {b['chunks_per_s']:.0f} chunks/s  index={b['index_type']}  "
+              f"peak RSS {b['peak_rss_mb']:.0f}MB  store {b['store_mb']:.1f}MB")
+    if "ingest" in result:
+        i = result["ingest"]
+        print(f"  ingest  {i['chunks']} chunks  {i['chunks_per_s']:.0f} chunks/s  {i['mb_per_s']:.1f} MB/s")
+    if "search" in result:
+        s = result["search"]
+        print(f"  search  p50={s['p50_ms']:.2f}ms  p99={s['p99_ms']:.2f}ms  ({s['mode']})")
+    for endpoint, a in result.get("api", {}).items():
+        if endpoint == "upstream":
+            continue
+        if "error" in a:
+            print(f"  {endpoint:9} {a['error']}")
+        else:
+            print(f"  {endpoint:9} {a['per_second']:.1f} req/s  p50={a['p50_ms']:.2f}ms  "
+                  f"p99={a['p99_ms']:.2f}ms  cold={a['cold_ms']:.1f}ms")
+
+if __name__ == "__main__":
+    main()
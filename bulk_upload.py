@@ -0,0 +1,151 @@
+import os
+import lzma
+import uuid
+import zlib
+import tarfile
+import zipfile
+
+EVIDENCE_SUFFIX = ".txt"
+ARCHIVE_SUFFIXES = (".zip", ".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tar.xz")
+# Largest single evidence file accepted, after decompression
+DEFAULT_MAX_FILE_BYTES = 20 * 1024 * 1024
+COPY_BUFFER_BYTES = 1024 * 1024
+# Most file systems cap a name at 255 bytes
+MAX_NAME_BYTES = 255
+
+# Errors a damaged archive or member raises while being read. gzip and bz2
+# report corrupt data as OSError, so these only guard reads, never writes.
+READ_ERRORS = (zlib.error, lzma.LZMAError, EOFError, OSError, zipfile.BadZipFile, tarfile.TarError)
+
+
+class UploadRejected(ValueError):
+    pass
+
+
+class UnreadableUpload(Exception):
+    """
+    Reading an upload or archive member failed; the evidence directory is fine.
+    """
+
+
+def max_file_bytes():
+    return int(os.getenv("MAX_UPLOAD_FILE_BYTES", str(DEFAULT_MAX_FILE_BYTES)))
+
+def safe_evidence_name(name):
+    """
+    Returns the bare file name to store an upload under, or raises
+    UploadRejected saying which rule failed. Directories inside archives are
+    flattened; hidden files, traversal and control characters are refused.
+    The suffix is case-sensitive, like the indexer's.
+    """
+    base = os.path.basename((name or "").replace("\\", "/"))
+    if not base.endswith(EVIDENCE_SUFFIX):
+        raise UploadRejected("only .txt files are allowed (lowercase suffix)")
+    if base.startswith("."):
+        raise UploadRejected("hidden file names (starting with '.') are not allowed")
+    if ".." in base:
+        raise UploadRejected("file names may not contain '..'")
+    if any(ord(c) < 32 or ord(c) == 127 for c in base):
+        raise UploadRejected("file names may not contain control characters")
+    if len(base.encode("utf-8")) > MAX_NAME_BYTES:
+        raise UploadRejected(f"file name longer than {MAX_NAME_BYTES} bytes")
+    return base
+
+def is_archive(name):
+    return (name or "").lower().endswith(ARCHIVE_SUFFIXES)
+
+def save_stream(source, name, directory="evidence"):
+    """
+    Copies a file object into the evidence directory in fixed-size blocks,
+    through a temp file renamed into place, so readers never see a partial
+    file. Returns the number of bytes written. Failed reads raise
+    UnreadableUpload; failed writes raise as they are.
+    """
+    limit = max_file_bytes()
+    path = os.path.join(directory, name)
+    # A short fixed-length temp name, so names near MAX_NAME_BYTES still fit
+    tmp_path = os.path.join(directory, f".upload-{uuid.uuid4().hex}")
+    written = 0
+    try:
+        with open(tmp_path, "xb") as out:
+            while True:
+                try:
+                    block = source.read(COPY_BUFFER_BYTES)
+                except READ_ERRORS as e:
+                    raise UnreadableUpload(str(e)) from e
+                if not block:
+                    break
+                written += len(block)
+                if written > limit:
+                    raise UploadRejected(f"file exceeds {limit} bytes")
+                out.write(block)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return written
+
+def _archive_members(fileobj, filename):
+    """
+    Yields (member name, readable file object) for the regular files of a
+    zip or tar archive without extracting it anywhere.
+    """
+    if filename.lower().endswith(".zip"):
+        # Zip needs its central directory; uploads are spooled to disk, so seeking is cheap
+        with zipfile.ZipFile(fileobj) as archive:
+            for info in archive.infolist():
+                if info.is_dir():
+                    continue
+                with archive.open(info) as member:
+                    yield info.filename, member
+    else:
+        # Streaming mode reads tar members strictly in order, never seeking back
+        with tarfile.open(fileobj=fileobj, mode="r|*") as archive:
+            for info in archive:
+                if not info.isfile():
+                    continue
+                member = archive.extractfile(info)
+                if member is not None:
+                    yield info.name, member
+
+def _save_one(source, name, directory, seen, origin=None):
+    entry = {"name": name, "status": "saved"}
+    if origin:
+        entry["archive"] = origin
+    try:
+        target = safe_evidence_name(name)
+        entry["name"] = target
+        if target in seen:
+            raise UploadRejected("duplicate name in this upload")
+        entry["bytes"] = save_stream(source, target, directory)
+        seen.add(target)
+    except UploadRejected as e:
+        entry.update(status="skipped", reason=str(e))
+    except UnreadableUpload as e:
+        entry.update(status="skipped", reason=f"unreadable: {e}")
+    return entry
+
+def iter_uploads(uploads, directory="evidence"):
+    """
+    Stores (filename, file object) uploads: plain .txt files and zip/tar
+    archives of them. Yields one summary entry per file as it is stored, so
+    callers keep what was saved even if a later upload fails.
+    """
+    seen = set()
+    for filename, fileobj in uploads:
+        if is_archive(filename):
+            members = _archive_members(fileobj, filename)
+            while True:
+                # Only the archive's own reads count as damage; errors saving
+                # a member (disk full, permissions) propagate to the caller
+                try:
+                    name, member = next(members)
+                except StopIteration:
+                    break
+                except READ_ERRORS as e:
+                    yield {"name": filename, "status": "skipped", "reason": f"unreadable archive: {e}"}
+                    break
+                yield _save_one(member, name, directory, seen, origin=filename)
+        else:
+            yield _save_one(fileobj, filename, directory, seen)
@@ -0,0 +1,160 @@
+import os
+import re
+import json
+import hashlib
+import threading
+from ingest import parse_case_id
+
+CATALOG_PATH = "case_catalog.json"
+
+# Words that look like entities to the naive extractor but carry no signal
+ENTITY_STOPWORDS = {"Case", "Date", "Time", "Report", "Evidence"}
+MAX_ENTITIES = 20
+
+# Any "Case: X" / "Case ID: X" reference in a file, not just the header
+CASE_REF_PATTERN = re.compile(r"Case(?: ID)?:[ \t]*([^\n]+)")
+
+# filename -> {"case_id", "case_refs", "size", "mtime", "entities"}
+_catalog = None
+_catalog_lock = threading.Lock()
+# Digest of the catalogued files, see corpus_version
+_corpus_version = None
+
+def extract_entities(content, limit=MAX_ENTITIES):
+    """
+    Naive NER: capitalized words longer than four letters, in order of
+    first appearance.
+    """
+    entities = []
+    seen = set()
+    for word in content.split():
+        if word and word[0].isupper() and len(word) > 4:
+            clean_word = word.strip(".,:;\"'")
+            if clean_word not in ENTITY_STOPWORDS and clean_word not in seen:
+                seen.add(clean_word)
+                entities.append(clean_word)
+                if len(entities) >= limit:
+                    break
+    return entities
+
+def _catalog_entry(file_path, stat):
+    with open(file_path, 'r', encoding='utf-8', errors='replace') as f:
+        content = f.read()
+    return {
+        "case_id": parse_case_id(content.split("\n", 1)[0]),
+        "case_refs": sorted({ref.strip() for ref in CASE_REF_PATTERN.findall(content)}),
+        "size": stat.st_size,
+        "mtime": stat.st_mtime_ns,
+        "entities": extract_entities(content),
+    }
+
+def _save_catalog(catalog):
+    tmp_path = f"{CATALOG_PATH}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(catalog, f)
+    os.replace(tmp_path, CATALOG_PATH)
+
+def _load_catalog():
+    try:
+        with open(CATALOG_PATH, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+def _set_catalog(catalog):
+    global _catalog, _corpus_version
+    digest = hashlib.sha256()
+    for filename, entry in sorted(catalog.items()):
+        digest.update(f"{filename}\0{entry['size']}\0{entry['mtime']}\n".encode("utf-8"))
+    # Catalog first: a reader may pair the old version with the new catalog,
+    # never the new version with stale data
+    _catalog = catalog
+    _corpus_version = digest.hexdigest()[:16]
+
+def refresh_catalog(directory="evidence"):
+    """
+    Brings the catalog in line with the evidence directory. Files whose size
+    and mtime are unchanged are not re-read. Returns the catalog.
+    """
+    with _catalog_lock:
+        current = _catalog if _catalog is not None else _load_catalog()
+        catalog = {}
+        changed = False
+        if os.path.exists(directory):
+            for filename in os.listdir(directory):
+                if not filename.endswith(".txt"):
+                    continue
+                file_path = os.path.join(directory, filename)
+                try:
+                    stat = os.stat(file_path)
+                    entry = current.get(filename)
+                    if entry and entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime_ns:
+                        catalog[filename] = entry
+                        continue
+                    catalog[filename] = _catalog_entry(file_path, stat)
+                    changed = True
+                except Exception as e:
+                    print(f"Error cataloguing {filename}: {e}")
+        if changed or set(catalog) != set(current):
+            _save_catalog(catalog)
+        _set_catalog(catalog)
+        return catalog
+
+def update_files(filenames, directory="evidence"):
+    """
+    Re-catalogs the given files, e.g. right after an upload, saving the
+    catalog once however many files there are.
+    """
+    get_catalog(directory)
+    with _catalog_lock:
+        # Copy the catalog under the lock, so concurrent uploads don't drop each other's entries
+        updated = dict(_catalog)
+        for filename in filenames:
+            file_path = os.path.join(directory, filename)
+            if os.path.exists(file_path):
+                updated[filename] = _catalog_entry(file_path, os.stat(file_path))
+            else:
+                updated.pop(filename, None)
+        _save_catalog(updated)
+        _set_catalog(updated)
+
+def update_file(filename, directory="evidence"):
+    update_files([filename], directory)
+
+def get_catalog(directory="evidence"):
+    """
+    Returns the in-memory catalog, building it on first use.
+    """
+    catalog = _catalog
+    if catalog is None:
+        catalog = refresh_catalog(directory)
+    return catalog
+
+def corpus_version(directory="evidence"):
+    """
+    Version of the evidence corpus: a digest of every catalogued file's
+    name, size and mtime. It changes whenever an upload or reindex changes
+    the catalog, and is the same across restarts for the same files.
+    """
+    get_catalog(directory)
+    return _corpus_version
+
+def list_cases(directory="evidence"):
+    return sorted({entry["case_id"] for entry in get_catalog(directory).values()})
+
+def files_for_case(case_id, directory="evidence"):
+    """
+    Returns (filename, entry) pairs belonging to a case, or every file for "All".
+    """
+    catalog = get_catalog(directory)
+    if case_id == "All":
+        return sorted(catalog.items())
+    first_word = case_id.lower().split()[0] if case_id.strip() else None
+    matches = []
+    for filename, entry in sorted(catalog.items()):
+        if entry["case_id"] == case_id or case_id in entry["case_refs"]:
+            matches.append((filename, entry))
+        # Fallback: if filename contains case name (simplified)
+        elif first_word and first_word in filename.lower():
+            matches.append((filename, entry))
+    return matches
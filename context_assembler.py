@@ -0,0 +1,165 @@
+import os
+from ingest import CHUNK_SIZE
+
+# Rough chars-per-token ratio for budgeting prompt context
+CHARS_PER_TOKEN = 4
+# Candidates retrieved per requested result, for MMR to choose from
+DEFAULT_POOL_FACTOR = 4
+# 1.0 ranks purely by relevance, 0.0 purely by novelty
+DEFAULT_MMR_LAMBDA = 0.7
+# Per-passage framing added by rag_chat.build_prompt
+PASSAGE_OVERHEAD_TOKENS = 8
+
+
+def context_settings():
+    """
+    (token budget, pool factor, MMR lambda) from CONTEXT_TOKEN_BUDGET,
+    CONTEXT_POOL_FACTOR and CONTEXT_MMR_LAMBDA. The budget is None unless
+    set; see default_token_budget.
+    """
+    budget = os.getenv("CONTEXT_TOKEN_BUDGET")
+    return (int(budget) if budget else None,
+            max(1, int(os.getenv("CONTEXT_POOL_FACTOR", str(DEFAULT_POOL_FACTOR)))),
+            float(os.getenv("CONTEXT_MMR_LAMBDA", str(DEFAULT_MMR_LAMBDA))))
+
+def estimate_tokens(text):
+    return len(text) // CHARS_PER_TOKEN + 1
+
+def default_token_budget(n_results):
+    """
+    Room for n_results full, unmerged chunks with their passage framing, so
+    packing never yields fewer passages than plain top-n retrieval.
+    """
+    return n_results * (CHUNK_SIZE // CHARS_PER_TOKEN + 1 + PASSAGE_OVERHEAD_TOKENS)
+
+def _normalize(vectors):
+    import numpy as np
+
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+def mmr_order(vectors, mmr_lambda=DEFAULT_MMR_LAMBDA):
+    """
+    Orders candidates, given in retrieval order, by maximal marginal
+    relevance. Relevance comes from the retrieval rank, so the fused hybrid
+    ranking (exact BM25 hits included) is kept; redundancy is the highest
+    cosine similarity to any candidate already picked.
+    """
+    import numpy as np
+
+    count = len(vectors)
+    vectors = _normalize(np.asarray(vectors, dtype='float32'))
+    relevance = 1.0 - np.arange(count) / max(count, 1)
+    similarity = vectors @ vectors.T
+    order = []
+    redundancy = np.full(count, -np.inf)
+    remaining = np.ones(count, dtype=bool)
+    for _ in range(count):
+        penalty = redundancy if order else 0.0
+        scores = mmr_lambda * relevance - (1 - mmr_lambda) * penalty
+        scores[~remaining] = -np.inf
+        best = int(np.argmax(scores))
+        order.append(best)
+        remaining[best] = False
+        redundancy = np.maximum(redundancy, similarity[best])
+    return order
+
+
+class _Passage:
+    """
+    A contiguous span of one source file, grown as chunks are merged in.
+    """
+
+    def __init__(self, meta, start, text, chunk_id):
+        self.meta = meta
+        self.start = start
+        self.text = text
+        self.chunk_ids = [chunk_id]
+
+    @property
+    def end(self):
+        return self.start + len(self.text)
+
+    def added_text(self, start, text):
+        """
+        Text this chunk would add if merged, or None if it neither overlaps
+        nor touches the passage.
+        """
+        end = start + len(text)
+        if end < self.start or start > self.end:
+            return None
+        return text[:max(0, self.start - start)] + text[max(0, self.end - start):]
+
+    def merge(self, start, text, chunk_ids):
+        if start < self.start:
+            self.text = text[:self.start - start] + self.text
+            self.start = start
+        if start + len(text) > self.end:
+            self.text += text[self.end - start:]
+        self.chunk_ids.extend(chunk_ids)
+
+
+def pack_context(store, results, token_budget=None, mmr_lambda=None, n_results=3):
+    """
+    Turns a deep retrieval result into prompt context: candidates are picked
+    in MMR order using the store's vectors, chunks overlapping or adjacent to
+    an already picked chunk of the same file are merged into one passage, and
+    picking stops once the token budget is full. Returns results in the
+    blind_search shape, one document per passage; "ids" lists every chunk
+    that made it in. Results from another generation than `store` (or
+    without rows) are packed in retrieval order instead. Without a budget
+    argument or CONTEXT_TOKEN_BUDGET, n_results full chunks always fit.
+    """
+    budget, _, default_lambda = context_settings()
+    if token_budget is None:
+        token_budget = budget if budget is not None else default_token_budget(n_results)
+    mmr_lambda = default_lambda if mmr_lambda is None else mmr_lambda
+
+    documents = results['documents'][0]
+    metadatas = results['metadatas'][0]
+    ids = results.get('ids', [[None] * len(documents)])[0]
+    rows = results.get('rows', [None])[0]
+    query_embedding = results.get('query_embedding')
+    if not documents:
+        return results
+
+    order = range(len(documents))
+    if store is not None and rows and results.get('version') == store.version and len(rows) > 1:
+        order = mmr_order(store.reconstruct(rows), mmr_lambda)
+
+    passages = []
+    used = 0
+    for i in order:
+        text, meta = documents[i], metadatas[i]
+        start = meta.get('offset')
+        target = None
+        if start is not None:
+            for passage in passages:
+                if passage.meta['source'] == meta['source']:
+                    added = passage.added_text(start, text)
+                    if added is not None:
+                        target = passage
+                        break
+        cost = estimate_tokens(added) if target else estimate_tokens(text) + PASSAGE_OVERHEAD_TOKENS
+        # Always keep the best chunk, even if it alone overruns the budget
+        if passages and used + cost > token_budget:
+            continue
+        used += cost
+        if target:
+            target.merge(start, text, [ids[i]])
+            # The new chunk may bridge the gap to another passage of the file
+            for other in [p for p in passages if p is not target and p.meta['source'] == meta['source']]:
+                if other.added_text(target.start, target.text) is not None:
+                    target.merge(other.start, other.text, other.chunk_ids)
+                    passages.remove(other)
+        else:
+            passages.append(_Passage(meta, start if start is not None else 0, text, ids[i]))
+
+    packed = {
+        "documents": [[p.text for p in passages]],
+        "metadatas": [[dict(p.meta, offset=p.start, chunks=len(p.chunk_ids)) for p in passages]],
+        "ids": [[chunk_id for p in passages for chunk_id in p.chunk_ids]],
+    }
+    if query_embedding is not None:
+        packed["query_embedding"] = query_embedding
+    return packed
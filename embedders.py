@@ -0,0 +1,460 @@
+import asyncio
+import os
+import re
+import time
+import zlib
+import random
+import threading
+import weakref
+from concurrent.futures import Future, ThreadPoolExecutor
+from dotenv import load_dotenv
+from embedding_cache import get_embedding_cache
+from metrics import RATE_LIMITED, RETRIES
+
+load_dotenv()
+
+EMBEDDING_MODEL = 'gemini-embedding-001'
+# Chunks embedded per request; also bounds build memory for streamed ingest
+EMBED_BATCH_SIZE = 50
+
+EMBEDDING_BACKENDS = ("gemini", "hashing", "sentence-transformers")
+DEFAULT_HASHING_DIMENSION = 768
+DEFAULT_SENTENCE_TRANSFORMER = "all-MiniLM-L6-v2"
+
+# Batch requests kept in flight during index builds
+DEFAULT_EMBED_CONCURRENCY = 4
+# First retry delay after a 429; doubles per attempt, with jitter
+EMBED_BACKOFF_SECONDS = 10
+
+# Global variable for the client, initially None
+_client = None
+
+# Shared by every build thread so concurrent batches respect one quota
+_rate_limiter = None
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+# Caps concurrent Gemini calls made from the async request path, one per
+# event loop: an asyncio.Semaphore binds to the first loop that waits on it
+_api_semaphores = weakref.WeakKeyDictionary()
+_api_semaphores_lock = threading.Lock()
+
+def get_api_semaphore():
+    """
+    Returns the semaphore bounding in-flight async Gemini calls on the
+    running event loop. The server has one loop; each asyncio.run (e.g.
+    timeline.extract_timeline) gets its own.
+    """
+    loop = asyncio.get_running_loop()
+    with _api_semaphores_lock:
+        semaphore = _api_semaphores.get(loop)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(int(os.getenv("GEMINI_MAX_CONCURRENCY", "8")))
+            _api_semaphores[loop] = semaphore
+    return semaphore
+
+def get_client():
+    """
+    Lazy loads the Gemini Client.
+    """
+    global _client
+    if _client is None:
+        api_key = os.getenv("GOOGLE_API_KEY")
+        if not api_key:
+            print("Warning: GOOGLE_API_KEY not found in environment variables.")
+            return None
+        # The SDK takes most of a second to import, so only pay for it on first use
+        from google.genai import Client
+        try:
+            _client = Client(api_key=api_key)
+        except Exception as e:
+            print(f"Error initializing Gemini Client: {e}")
+            return None
+    return _client
+
+def is_rate_limit(error):
+    error_str = str(error)
+    return "429" in error_str or "RESOURCE_EXHAUSTED" in error_str
+
+def backoff_delay(attempt, base=EMBED_BACKOFF_SECONDS):
+    # Full doubling with +/-50% jitter so parallel retries don't line up
+    return base * (2 ** attempt) * random.uniform(0.5, 1.5)
+
+def rate_limit_backoff(error, attempt, retries, operation, base=EMBED_BACKOFF_SECONDS):
+    """
+    Shared bookkeeping after a failed Gemini call: counts the rate limit and
+    the retry under operation and returns the seconds to wait before trying
+    again, or None if the error isn't a 429 or this was the last attempt.
+    Callers wait in whatever way suits them (sleep, asyncio.sleep, pause).
+    """
+    if not is_rate_limit(error):
+        return None
+    RATE_LIMITED.inc(operation=operation)
+    if attempt >= retries - 1:
+        return None
+    RETRIES.inc(operation=operation)
+    delay = backoff_delay(attempt, base)
+    print(f"Rate limit hit ({operation}). Waiting {delay:.1f}s (Attempt {attempt + 1})...")
+    return delay
+
+
+class TokenBucket:
+    """
+    Requests-per-minute limiter shared across threads. A rate of 0 disables
+    it. After a 429, pause() holds every caller back, not just the one that
+    was rejected.
+    """
+
+    def __init__(self, per_minute, burst=None):
+        self.rate = per_minute / 60.0
+        self.capacity = float(burst or max(1, per_minute // 6)) if per_minute else 0.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if not self.rate:
+            wait = self.paused_until - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if now >= self.paused_until and self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = max(self.paused_until - now, (1 - self.tokens) / self.rate)
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        with self._lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self.tokens = 0.0
+
+def get_rate_limiter():
+    """
+    Returns the token bucket for embedding requests (GEMINI_EMBED_RPM, 0 = unlimited).
+    """
+    global _rate_limiter
+    if _rate_limiter is None:
+        _rate_limiter = TokenBucket(int(os.getenv("GEMINI_EMBED_RPM", "0")))
+    return _rate_limiter
+
+def embed_concurrency():
+    return max(1, int(os.getenv("EMBED_CONCURRENCY", str(DEFAULT_EMBED_CONCURRENCY))))
+
+def get_scheduler():
+    """
+    Returns the thread pool that keeps embedding batches in flight.
+    """
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = ThreadPoolExecutor(max_workers=embed_concurrency(),
+                                            thread_name_prefix="embed")
+    return _scheduler
+
+
+class Embedder:
+    """
+    Turns texts into float32 vectors. `name` is recorded in the store so
+    queries are embedded by the same backend and model that built it.
+    """
+
+    name = None
+    # Remote or expensive backends go through the on-disk embedding cache
+    cacheable = True
+    # API batches worth sending at once; builds buffer this many batches
+    concurrency = 1
+
+    def available(self):
+        return True
+
+    def dimension(self):
+        return len(self.embed(["dimension probe"])[0])
+
+    def embed(self, texts, retries=3):
+        """
+        Embeds texts, serving repeats from the embedding cache and computing
+        only cache misses.
+        """
+        if not self.cacheable:
+            return list(self._embed_uncached(texts, retries))
+        cache = get_embedding_cache()
+        embeddings = cache.get_many(texts, self.name)
+        missing = [i for i, e in enumerate(embeddings) if e is None]
+        if missing:
+            batch = [texts[i] for i in missing]
+            fresh = self._embed_uncached(batch, retries)
+            cache.put_many(batch, self.name, fresh)
+            for i, vector in zip(missing, fresh):
+                embeddings[i] = vector
+        return embeddings
+
+    def submit(self, texts, retries=3):
+        """
+        Starts embedding one batch and returns a Future of its vectors.
+        Builds keep several batches submitted; local backends just embed
+        inline and return a finished Future.
+        """
+        future = Future()
+        try:
+            future.set_result(self.embed(texts, retries))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    async def embed_async(self, texts, retries=3):
+        # Local backends are CPU-bound: run them off the event loop
+        return await asyncio.to_thread(self.embed, texts, retries)
+
+    def _embed_uncached(self, texts, retries):
+        raise NotImplementedError
+
+
+class GeminiEmbedder(Embedder):
+    """
+    Gemini embedding API, batched, with backoff on rate limits.
+    """
+
+    def __init__(self, model=EMBEDDING_MODEL):
+        self.model = model
+        self.name = model
+
+    @property
+    def concurrency(self):
+        return embed_concurrency()
+
+    def available(self):
+        return get_client() is not None
+
+    def _embed_batch(self, client, batch, retries, limiter=None):
+        """
+        Sends one batch, retrying only this batch on a 429. Build batches
+        pass the shared limiter, which paces them and holds every build
+        thread back after a 429; queries pass none and only wait out their
+        own retries.
+        """
+        for attempt in range(retries):
+            if limiter is not None:
+                limiter.acquire()
+            try:
+                response = client.models.embed_content(
+                    model=self.model,
+                    contents=batch
+                )
+                return [e.values for e in response.embeddings]
+            except Exception as e:
+                delay = rate_limit_backoff(e, attempt, retries, "embed")
+                if delay is None:
+                    raise e
+                if limiter is not None:
+                    limiter.pause(delay)
+                else:
+                    time.sleep(delay)
+
+    def submit(self, texts, retries=3):
+        """
+        Queues one batch on the embedding scheduler. Cached texts are served
+        right away; the rest are sent as one request and cached as soon as
+        it succeeds, whatever happens to other batches.
+        """
+        cache = get_embedding_cache()
+        embeddings = cache.get_many(texts, self.name)
+        missing = [i for i, e in enumerate(embeddings) if e is None]
+        if not missing:
+            future = Future()
+            future.set_result(embeddings)
+            return future
+        client = get_client()
+        if client is None:
+            raise RuntimeError("Gemini client not initialized.")
+        batch = [texts[i] for i in missing]
+
+        def run():
+            fresh = self._embed_batch(client, batch, retries, get_rate_limiter())
+            cache.put_many(batch, self.name, fresh)
+            for i, vector in zip(missing, fresh):
+                embeddings[i] = vector
+            return embeddings
+
+        return get_scheduler().submit(run)
+
+    def embed(self, texts, retries=3):
+        """
+        Embeds texts on the calling thread, for queries and probes. They
+        bypass the build scheduler and rate limiter, so they never queue
+        behind build batches, and a 429 on the last attempt reaches the
+        caller (e.g. for the lexical fallback) instead of waiting it out.
+        """
+        cache = get_embedding_cache()
+        embeddings = cache.get_many(texts, self.name)
+        missing = [i for i, e in enumerate(embeddings) if e is None]
+        if not missing:
+            return embeddings
+        client = get_client()
+        if client is None:
+            raise RuntimeError("Gemini client not initialized.")
+        for start in range(0, len(missing), EMBED_BATCH_SIZE):
+            rows = missing[start:start + EMBED_BATCH_SIZE]
+            batch = [texts[i] for i in rows]
+            fresh = self._embed_batch(client, batch, retries)
+            cache.put_many(batch, self.name, fresh)
+            for i, vector in zip(rows, fresh):
+                embeddings[i] = vector
+        return embeddings
+
+    async def embed_async(self, documents, retries=3):
+        """
+        Uses the async client, holds an upstream concurrency slot and backs
+        off with asyncio.sleep so the event loop keeps serving other requests.
+        Cache reads and writes hit SQLite and may wait on a build's writes,
+        so they run on a worker thread too.
+        """
+        cache = await asyncio.to_thread(get_embedding_cache)
+        embeddings = await asyncio.to_thread(cache.get_many, documents, self.name)
+        missing = [i for i, e in enumerate(embeddings) if e is None]
+        if not missing:
+            return embeddings
+        texts = [documents[i] for i in missing]
+        client = get_client()
+        if client is None:
+            raise RuntimeError("Gemini client not initialized.")
+
+        for attempt in range(retries):
+            try:
+                async with get_api_semaphore():
+                    response = await client.aio.models.embed_content(
+                        model=self.model,
+                        contents=texts
+                    )
+                fresh = [e.values for e in response.embeddings]
+                break
+            except Exception as e:
+                delay = rate_limit_backoff(e, attempt, retries, "embed")
+                if delay is None:
+                    raise e
+                await asyncio.sleep(delay)
+
+        await asyncio.to_thread(cache.put_many, texts, self.name, fresh)
+        for i, vector in zip(missing, fresh):
+            embeddings[i] = vector
+        return embeddings
+
+
+class HashingEmbedder(Embedder):
+    """
+    Offline CPU embedder: signed feature hashing of word unigrams and
+    bigrams into a fixed-size, L2-normalized vector. Deterministic across
+    processes, needs no model files and embeds thousands of chunks a second.
+    """
+
+    cacheable = False
+    _token_pattern = re.compile(r"\w+")
+
+    def __init__(self, dimension=DEFAULT_HASHING_DIMENSION):
+        self._dimension = int(dimension)
+        self.name = f"hashing-v1:{self._dimension}"
+
+    def dimension(self):
+        return self._dimension
+
+    def _embed_uncached(self, texts, retries):
+        import numpy as np
+
+        rows = []
+        columns = []
+        values = []
+        for row, text in enumerate(texts):
+            tokens = self._token_pattern.findall(text.lower())
+            features = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+            for feature in features:
+                # crc32 is stable across processes, unlike hash()
+                h = zlib.crc32(feature.encode("utf-8"))
+                rows.append(row)
+                columns.append(h % self._dimension)
+                values.append(1.0 if h & 0x80000000 else -1.0)
+
+        matrix = np.zeros((len(texts), self._dimension), dtype='float32')
+        if rows:
+            np.add.at(matrix, (np.array(rows), np.array(columns)), np.array(values, dtype='float32'))
+        # Dampen repeated terms, then normalize so L2 distance tracks cosine
+        matrix = np.sign(matrix) * np.log1p(np.abs(matrix))
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+
+
+class SentenceTransformerEmbedder(Embedder):
+    """
+    Local sentence-transformers model (optional dependency), batched on CPU.
+    """
+
+    def __init__(self, model=DEFAULT_SENTENCE_TRANSFORMER):
+        self.model_name = model
+        self.name = f"sentence-transformers:{model}"
+        self._model = None
+
+    def _load(self):
+        if self._model is None:
+            try:
+                from sentence_transformers import SentenceTransformer
+            except ImportError:
+                raise RuntimeError(
+                    "The sentence-transformers backend needs `pip install sentence-transformers`."
+                )
+            self._model = SentenceTransformer(self.model_name, device="cpu")
+        return self._model
+
+    def available(self):
+        try:
+            self._load()
+            return True
+        except Exception as e:
+            print(f"Error loading sentence-transformers model: {e}")
+            return False
+
+    def dimension(self):
+        return self._load().get_sentence_embedding_dimension()
+
+    def _embed_uncached(self, texts, retries):
+        return self._load().encode(texts, batch_size=64, convert_to_numpy=True,
+                                   normalize_embeddings=True).astype('float32')
+
+
+_embedders = {}
+
+def embedder_for(name):
+    """
+    Returns the embedder for a recorded name, e.g. the one stored in a
+    generation's metadata.
+    """
+    embedder = _embedders.get(name)
+    if embedder is None:
+        if name.startswith("hashing-v1:"):
+            embedder = HashingEmbedder(int(name.split(":", 1)[1]))
+        elif name.startswith("sentence-transformers:"):
+            embedder = SentenceTransformerEmbedder(name.split(":", 1)[1])
+        else:
+            embedder = GeminiEmbedder(name)
+        _embedders[name] = embedder
+    return embedder
+
+def get_embedder(backend=None):
+    """
+    Returns the embedder configured for building indexes:
+    EMBEDDING_BACKEND selects the backend, EMBEDDING_MODEL_NAME its model
+    and HASHING_DIMENSION the size of hashed vectors.
+    """
+    backend = (backend or os.getenv("EMBEDDING_BACKEND", "gemini")).lower()
+    if backend == "gemini":
+        return embedder_for(os.getenv("EMBEDDING_MODEL_NAME", EMBEDDING_MODEL))
+    if backend == "hashing":
+        return embedder_for(f"hashing-v1:{int(os.getenv('HASHING_DIMENSION', DEFAULT_HASHING_DIMENSION))}")
+    if backend == "sentence-transformers":
+        return embedder_for(f"sentence-transformers:{os.getenv('EMBEDDING_MODEL_NAME', DEFAULT_SENTENCE_TRANSFORMER)}")
+    raise ValueError(f"Unknown embedding backend '{backend}'. Expected one of {', '.join(EMBEDDING_BACKENDS)}.")
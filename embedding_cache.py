@@ -0,0 +1,98 @@
+import hashlib
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+
+
+def _text_key(text, model):
+    return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Embedding cache keyed by sha256(model + text).
+    An in-memory LRU sits in front of a SQLite table on disk, so repeated
+    queries skip the disk and rebuilds after a restart skip the network.
+    """
+
+    def __init__(self, path="embedding_cache.sqlite3", memory_size=2048):
+        self.path = path
+        self.memory_size = memory_size
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, model TEXT, vector BLOB)"
+        )
+        self._conn.commit()
+
+    def _remember(self, key, vector):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def get_many(self, texts, model):
+        """
+        Returns a list aligned with texts holding cached vectors or None.
+        """
+        import numpy as np
+
+        keys = [_text_key(t, model) for t in texts]
+        results = [None] * len(texts)
+        missing = {}
+        with self._lock:
+            for i, key in enumerate(keys):
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    results[i] = vector
+                else:
+                    missing.setdefault(key, []).append(i)
+
+            # SQLite caps the number of bound parameters per statement
+            pending = list(missing)
+            for start in range(0, len(pending), 500):
+                chunk = pending[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", chunk
+                ).fetchall()
+                for key, blob in rows:
+                    vector = np.frombuffer(blob, dtype="float32")
+                    self._remember(key, vector)
+                    for i in missing[key]:
+                        results[i] = vector
+        return results
+
+    def put_many(self, texts, model, vectors):
+        import numpy as np
+
+        rows = []
+        with self._lock:
+            for text, vector in zip(texts, vectors):
+                key = _text_key(text, model)
+                vector = np.asarray(vector, dtype="float32")
+                self._remember(key, vector)
+                rows.append((key, model, vector.tobytes()))
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, model, vector) VALUES (?, ?, ?)", rows
+            )
+            self._conn.commit()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_embedding_cache():
+    """
+    Lazily opens the process-wide embedding cache.
+    """
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = EmbeddingCache(os.getenv("EMBEDDING_CACHE_PATH", "embedding_cache.sqlite3"))
+    return _cache
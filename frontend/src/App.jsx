@@ -146,7 +146,7 @@ function App() {
     setIsLoading(true);
 
     try {
-      const response = await axios.post(`${API_BASE_URL}/chat`, { message: input });
+      const response = await axios.post(`${API_BASE_URL}/chat`, { message: input, case_id: selectedCase });
 
       setMessages(prev => [...prev, { role: 'assistant', content: response.data.response }]);
 
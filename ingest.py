@@ -1,48 +1,197 @@
 import os
 import json
+import hashlib
 
-def chunk_text(text, chunk_size=500, overlap=50):
+CHUNK_SIZE = 500
+CHUNK_OVERLAP = 50
+
+# Process-pool workers for chunking. Chunking is cheap next to pickling each
+# file's chunks back from a worker, so serial ingest measured faster at every
+# corpus size tried (2-5x); a pool is opt-in through INGEST_WORKERS.
+DEFAULT_INGEST_WORKERS = 1
+# Workers return a file's chunks all at once, so larger files are streamed
+# in-process instead, keeping memory bounded by this size per file in flight
+PARALLEL_INGEST_MAX_FILE_BYTES = 4 * 1024 * 1024
+
+def chunk_spans(text, chunk_size=CHUNK_SIZE, overlap=CHUNK_OVERLAP):
     """
-    Splits text into smaller chunks with overlap to maintain context.
+    Splits text into overlapping chunks, returning (offset, chunk) pairs.
     """
-    chunks = []
+    spans = []
     start = 0
     while start < len(text):
         end = start + chunk_size
-        chunks.append(text[start:end])
+        spans.append((start, text[start:end]))
         start += (chunk_size - overlap)
-    return chunks
+    return spans
+
+def chunk_text(text, chunk_size=CHUNK_SIZE, overlap=CHUNK_OVERLAP):
+    """
+    Splits text into smaller chunks with overlap to maintain context.
+    """
+    return [chunk for _, chunk in chunk_spans(text, chunk_size, overlap)]
+
+def parse_case_id(first_line):
+    """
+    Returns the case ID from a "Case ID: ..." or "Case: ..." header line,
+    or "Uncategorized" if the file has no such header.
+    """
+    first_line = first_line.strip()
+    if ":" in first_line and (first_line.startswith("Case ID:") or first_line.startswith("Case:")):
+        return first_line.split(":")[1].strip()
+    return "Uncategorized"
+
+def content_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def make_chunk_id(source, offset, content):
+    """
+    Stable 63-bit ID for a chunk, usable directly as a FAISS vector ID.
+    Unchanged chunks keep their ID across re-ingests.
+    """
+    digest = hashlib.sha256(f"{source}\0{offset}\0{content}".encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") & 0x7FFFFFFFFFFFFFFF
+
+def file_hash(file_path, block_size=1024 * 1024):
+    """
+    SHA-256 of a file's bytes, read in blocks.
+    """
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def iter_chunk_spans(f, chunk_size=CHUNK_SIZE, overlap=CHUNK_OVERLAP, block_size=64 * 1024):
+    """
+    Streaming version of chunk_spans over an open text file: yields the same
+    (offset, chunk) pairs while holding only about one block in memory.
+    """
+    step = chunk_size - overlap
+    buffer = ""
+    buffer_start = 0
+    start = 0
+    eof = False
+    while True:
+        while not eof and len(buffer) - (start - buffer_start) < chunk_size:
+            block = f.read(block_size)
+            if not block:
+                eof = True
+            buffer += block
+        rel = start - buffer_start
+        if rel >= len(buffer):
+            return
+        yield start, buffer[rel:rel + chunk_size]
+        start += step
+        # Drop text no later chunk can reach
+        if start - buffer_start >= block_size:
+            buffer = buffer[start - buffer_start:]
+            buffer_start = start
+
+def iter_file_chunks(directory, filename):
+    """
+    Yields the chunk dicts of a single evidence file. Every chunk carries the
+    case ID from the file's header line, so searches can be scoped to a case.
+    """
+    file_path = os.path.join(directory, filename)
+    digest = file_hash(file_path)
+    with open(file_path, 'r', encoding='utf-8', errors='replace') as f:
+        case_id = parse_case_id(f.readline())
+        f.seek(0)
+        for offset, chunk in iter_chunk_spans(f):
+            yield {
+                'id': make_chunk_id(filename, offset, chunk),
+                'content': chunk,
+                'source': filename,
+                'offset': offset,
+                'case_id': case_id,
+                'file_hash': digest
+            }
+
+def _chunk_file(args):
+    # Process pool worker: chunks one file, returning its chunks as a list
+    directory, filename = args
+    try:
+        return list(iter_file_chunks(directory, filename))
+    except Exception as e:
+        print(f"Skipping {filename} due to ingest error: {e}")
+        return []
+
+def _pool_context():
+    # Forking a multithreaded server (event loop, embed pool, SQLite) can
+    # copy held locks into the children; start clean interpreters instead
+    import multiprocessing
+
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+
+def _pooled(directory, filename):
+    # Small files go to the pool; large ones are streamed in-process
+    try:
+        return os.path.getsize(os.path.join(directory, filename)) <= PARALLEL_INGEST_MAX_FILE_BYTES
+    except OSError:
+        return False
+
+def _iter_file_safely(directory, filename):
+    try:
+        yield from iter_file_chunks(directory, filename)
+    except Exception as e:
+        print(f"Skipping {filename} due to ingest error: {e}")
+
+def iter_evidence(directory, workers=None):
+    """
+    Yields evidence chunks one at a time, in file order, without loading the
+    corpus into memory. With more than one worker (INGEST_WORKERS), files
+    are chunked by a process pool with a bounded number of files in flight;
+    files over PARALLEL_INGEST_MAX_FILE_BYTES are streamed in-process in
+    their turn.
+    """
+    if not os.path.exists(directory):
+        print(f"Error: Directory {directory} not found.")
+        return
+
+    filenames = sorted(f for f in os.listdir(directory) if f.endswith(".txt"))
+    if workers is None:
+        workers = int(os.getenv("INGEST_WORKERS", str(DEFAULT_INGEST_WORKERS)))
+
+    if workers <= 1:
+        for filename in filenames:
+            yield from _iter_file_safely(directory, filename)
+        return
+
+    from collections import deque
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=workers, mp_context=_pool_context()) as pool:
+        # (filename, future), with no future for files streamed in-process
+        in_flight = deque()
+        names = iter(filenames)
+
+        def submit_next():
+            filename = next(names, None)
+            if filename is None:
+                return
+            future = pool.submit(_chunk_file, (directory, filename)) if _pooled(directory, filename) else None
+            in_flight.append((filename, future))
+
+        for _ in range(workers * 2):
+            submit_next()
+        while in_flight:
+            filename, future = in_flight.popleft()
+            submit_next()
+            if future is None:
+                yield from _iter_file_safely(directory, filename)
+            else:
+                yield from future.result()
 
 def ingest_evidence(directory):
     """
     Reads text files from a directory and returns a data structure 
     that separates content from source metadata.
+    Each chunk also carries a stable ID, its offset, its case ID and its
+    file's hash.
+    Prefer iter_evidence for large corpora.
     """
-    evidence_data = []
-    
-    if not os.path.exists(directory):
-        print(f"Error: Directory {directory} not found.")
-        return evidence_data
-
-    for filename in os.listdir(directory):
-        if filename.endswith(".txt"):
-            file_path = os.path.join(directory, filename)
-            try:
-                with open(file_path, 'r', encoding='utf-8', errors='replace') as f:
-                    full_content = f.read()
-                    
-                    # Split into chunks (Optional but recommended)
-                    chunks = chunk_text(full_content)
-                    
-                    for chunk in chunks:
-                        evidence_data.append({
-                            'content': chunk,
-                            'source': filename
-                        })
-            except Exception as e:
-                print(f"Skipping {filename} due to ingest error: {e}")
-    
-    return evidence_data
+    return list(iter_evidence(directory))
 
 if __name__ == "__main__":
     evidence_path = "evidence"
@@ -0,0 +1,213 @@
+import os
+import re
+import json
+import math
+from array import array
+
+# Hyphenated identifiers (plates, badge and case numbers) stay one token;
+# their parts are indexed too so "BGT" alone still matches "BGT-442"
+TOKEN_PATTERN = re.compile(r"\w+(?:-\w+)*")
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+VOCAB_FILE = "bm25_vocab.json"
+ROWS_FILE = "bm25_rows.npy"
+TFS_FILE = "bm25_tfs.npy"
+LENGTHS_FILE = "bm25_lengths.npy"
+# Sorted postings runs spilled during a build, merged when it finishes
+RUN_PREFIX = "bm25_run-"
+
+# Rows buffered in memory before their postings are spilled to a run
+SPILL_ROWS = 10_000
+
+
+def tokenize(text):
+    tokens = []
+    for match in TOKEN_PATTERN.findall(text.lower()):
+        tokens.append(match)
+        if "-" in match:
+            tokens.extend(part for part in match.split("-") if part)
+    return tokens
+
+
+class LexicalIndexWriter:
+    """
+    Builds an inverted index row by row alongside a store generation.
+    Postings are spilled to sorted runs in the generation directory every
+    SPILL_ROWS rows and merged by finish(), so memory follows the run size
+    rather than the corpus.
+    """
+
+    def __init__(self, path, spill_rows=SPILL_ROWS):
+        self.path = path
+        self.spill_rows = spill_rows
+        self._postings = {}
+        self._pending_rows = 0
+        self._runs = 0
+        self._lengths = array('i')
+
+    def add(self, row, text):
+        counts = {}
+        tokens = tokenize(text)
+        for token in tokens:
+            counts[token] = counts.get(token, 0) + 1
+        for token, tf in counts.items():
+            posting = self._postings.get(token)
+            if posting is None:
+                posting = self._postings[token] = (array('q'), array('i'))
+            posting[0].append(row)
+            posting[1].append(tf)
+        self._lengths.append(len(tokens))
+        self._pending_rows += 1
+        if self._pending_rows >= self.spill_rows:
+            self._spill()
+
+    def _run_paths(self, run):
+        prefix = os.path.join(self.path, f"{RUN_PREFIX}{run}")
+        return f"{prefix}.terms", f"{prefix}.rows", f"{prefix}.tfs"
+
+    def _spill(self):
+        """
+        Writes the buffered postings as one run: terms in sorted order with
+        their posting counts, and the rows and tfs back to back.
+        """
+        if not self._postings:
+            return
+        terms_path, rows_path, tfs_path = self._run_paths(self._runs)
+        with open(terms_path, 'w', encoding='utf-8') as terms, \
+                open(rows_path, 'wb') as rows, open(tfs_path, 'wb') as tfs:
+            for term in sorted(self._postings):
+                term_rows, term_tfs = self._postings[term]
+                terms.write(f"{term}\t{len(term_rows)}\n")
+                term_rows.tofile(rows)
+                term_tfs.tofile(tfs)
+        self._runs += 1
+        self._postings = {}
+        self._pending_rows = 0
+
+    def _iter_run(self, run):
+        """
+        Yields (term, run, start, end) for each term of a run, in term order.
+        """
+        start = 0
+        with open(self._run_paths(run)[0], 'r', encoding='utf-8') as f:
+            for line in f:
+                term, count = line.rstrip("\n").split("\t")
+                end = start + int(count)
+                yield term, run, start, end
+                start = end
+
+    def finish(self):
+        """
+        Merges the spilled runs into the final postings files. Runs cover
+        ascending row ranges, so appending a term's postings run by run
+        keeps its rows sorted.
+        """
+        import heapq
+        import itertools
+        import numpy as np
+
+        self._spill()
+        run_rows = []
+        run_tfs = []
+        total = 0
+        for run in range(self._runs):
+            _, rows_path, tfs_path = self._run_paths(run)
+            # Runs are only spilled with postings, so none is empty
+            run_rows.append(np.memmap(rows_path, dtype='int64', mode='r'))
+            run_tfs.append(np.memmap(tfs_path, dtype='int32', mode='r'))
+            total += len(run_rows[-1])
+
+        rows = np.lib.format.open_memmap(os.path.join(self.path, ROWS_FILE), mode='w+', dtype='int64',
+                                         shape=(total,))
+        tfs = np.lib.format.open_memmap(os.path.join(self.path, TFS_FILE), mode='w+', dtype='int32',
+                                        shape=(total,))
+        vocab = {}
+        position = 0
+        merged = heapq.merge(*(self._iter_run(run) for run in range(self._runs)))
+        for term, spans in itertools.groupby(merged, key=lambda span: span[0]):
+            term_start = position
+            for _, run, start, end in spans:
+                rows[position:position + end - start] = run_rows[run][start:end]
+                tfs[position:position + end - start] = run_tfs[run][start:end]
+                position += end - start
+            vocab[term] = [term_start, position]
+        rows.flush()
+        tfs.flush()
+        del rows, tfs, run_rows, run_tfs
+
+        np.save(os.path.join(self.path, LENGTHS_FILE), np.frombuffer(self._lengths, dtype='int32'))
+        with open(os.path.join(self.path, VOCAB_FILE), 'w', encoding='utf-8') as f:
+            json.dump(vocab, f)
+        for run in range(self._runs):
+            for run_path in self._run_paths(run):
+                os.remove(run_path)
+        self._runs = 0
+
+
+class LexicalIndex:
+    """
+    Read-only BM25 index over a store generation; postings are mmapped.
+    """
+
+    def __init__(self, path):
+        import numpy as np
+
+        with open(os.path.join(path, VOCAB_FILE), 'r', encoding='utf-8') as f:
+            self.vocab = json.load(f)
+        self.rows = np.load(os.path.join(path, ROWS_FILE), mmap_mode='r')
+        self.tfs = np.load(os.path.join(path, TFS_FILE), mmap_mode='r')
+        self.lengths = np.load(os.path.join(path, LENGTHS_FILE), mmap_mode='r')
+        self.count = len(self.lengths)
+        self.avg_length = float(self.lengths.mean()) if self.count else 0.0
+
+    @staticmethod
+    def exists(path):
+        return os.path.exists(os.path.join(path, VOCAB_FILE))
+
+    def search(self, query, k, rows=None):
+        """
+        Returns up to k (row, score) pairs by BM25 score, best first.
+        rows, a sorted array, restricts the search to those rows.
+        """
+        import numpy as np
+
+        if not self.count:
+            return []
+        hit_rows = []
+        hit_scores = []
+        for term in set(tokenize(query)):
+            span = self.vocab.get(term)
+            if span is None:
+                continue
+            term_rows = np.asarray(self.rows[span[0]:span[1]])
+            tfs = np.asarray(self.tfs[span[0]:span[1]], dtype='float64')
+            df = span[1] - span[0]
+            idf = math.log(1 + (self.count - df + 0.5) / (df + 0.5))
+            lengths = np.asarray(self.lengths[term_rows], dtype='float64')
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths / (self.avg_length or 1.0))
+            hit_rows.append(term_rows)
+            hit_scores.append(idf * tfs * (BM25_K1 + 1) / (tfs + norm))
+        if not hit_rows:
+            return []
+
+        # Sum per-term scores per row without a dense corpus-sized array
+        unique_rows, inverse = np.unique(np.concatenate(hit_rows), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(hit_scores))
+        if rows is not None:
+            keep = np.isin(unique_rows, rows, assume_unique=True)
+            unique_rows, scores = unique_rows[keep], scores[keep]
+        top = np.argsort(-scores)[:k]
+        return [(int(unique_rows[i]), float(scores[i])) for i in top]
+
+
+def reciprocal_rank_fusion(rankings, k, constant=60):
+    """
+    Fuses ranked lists of rows into one ranking of at most k rows.
+    """
+    scores = {}
+    for ranking in rankings:
+        for rank, row in enumerate(ranking):
+            scores[row] = scores.get(row, 0.0) + 1.0 / (constant + rank + 1)
+    return sorted(scores, key=lambda row: -scores[row])[:k]
@@ -0,0 +1,162 @@
+"""
+Dependency-free counters, gauges and histograms rendered in the Prometheus
+text format, plus timing spans that also feed per-request timings.
+"""
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+TOKEN_BUCKETS = (100, 250, 500, 1000, 2000, 4000, 8000, 16000, 32000)
+
+# Rough chars-per-token ratio, used when the API doesn't report usage
+CHARS_PER_TOKEN = 4
+
+_registry = []
+_request_timings = contextvars.ContextVar("request_timings", default=None)
+
+
+def _label_text(labelnames, values):
+    if not labelnames:
+        return ""
+    pairs = []
+    for name, value in zip(labelnames, values):
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _key(self, labels):
+        return tuple(labels.get(name, "") for name in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_label_text(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets) + (float("inf"),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+                    break
+            entry[1] += value
+            entry[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        names = self.labelnames + ("le",)
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, bucket in zip(self.buckets, counts):
+                    cumulative += bucket
+                    lines.append(f"{self.name}_bucket{_label_text(names, key + (_format_value(bound),))} {cumulative}")
+                labels = _label_text(self.labelnames, key)
+                lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+                lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+STAGE_SECONDS = Histogram("rag_stage_seconds", "Time spent in each pipeline stage.", ("stage",))
+HTTP_SECONDS = Histogram("rag_http_request_seconds", "HTTP request latency.", ("method", "path", "status"))
+RETRIES = Counter("rag_retries_total", "Upstream calls retried after an error.", ("operation",))
+RATE_LIMITED = Counter("rag_rate_limited_total", "Upstream calls rejected with a rate limit.", ("operation",))
+SEARCH_FALLBACKS = Counter("rag_search_fallback_total", "Searches answered lexically because embedding was unavailable.")
+EMBEDDED_CHUNKS = Counter("rag_build_embedded_chunks_total", "Chunks embedded by index builds.")
+PROMPT_TOKENS = Histogram("rag_prompt_tokens", "Prompt size sent to the generation model.", ("operation",),
+                          buckets=TOKEN_BUCKETS)
+INDEX_VECTORS = Gauge("rag_index_vectors", "Vectors in the resident index.", ("store",))
+INDEX_VERSION = Gauge("rag_index_version", "Version of the resident index generation.", ("store",))
+
+
+@contextmanager
+def span(stage):
+    """
+    Times a block into rag_stage_seconds and the current request's timings.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, stage=stage)
+        timings = _request_timings.get()
+        if timings is not None:
+            timings[stage] = timings.get(stage, 0.0) + elapsed
+
+def record_prompt(operation, prompt, response=None):
+    """
+    Observes a prompt's token count, from the API's usage data when present.
+    """
+    usage = getattr(response, "usage_metadata", None)
+    tokens = getattr(usage, "prompt_token_count", None)
+    if not isinstance(tokens, int):
+        tokens = len(prompt) // CHARS_PER_TOKEN
+    PROMPT_TOKENS.observe(tokens, operation=operation)
+
+def start_request_timing():
+    """
+    Starts collecting span timings for the current request; returns the dict
+    they accumulate into (seconds per stage).
+    """
+    timings = {}
+    _request_timings.set(timings)
+    return timings
+
+def server_timing_header(timings):
+    return ", ".join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in timings.items())
+
+def render_metrics():
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
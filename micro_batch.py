@@ -0,0 +1,85 @@
+import os
+import asyncio
+import threading
+import weakref
+
+DEFAULT_WINDOW_MS = 5
+DEFAULT_MAX_BATCH = 32
+
+
+class MicroBatcher:
+    """
+    Collects items submitted by concurrent requests for up to `window_ms`
+    (or until `max_batch` are waiting) and hands them to
+    `handler(key, items)` as one batch. Items only batch with others under
+    the same key; the handler returns one result per item, in order, and
+    each submitter gets its own. A handler error fails the whole batch.
+    Batches are kept per event loop, so a batcher shared by the whole
+    process never mixes futures or timers of different loops.
+    """
+
+    def __init__(self, handler, window_ms=DEFAULT_WINDOW_MS, max_batch=DEFAULT_MAX_BATCH):
+        self.handler = handler
+        self.window = window_ms / 1000.0
+        self.max_batch = max_batch
+        # loop -> (pending batches by key, flush timers by key)
+        self._loops = weakref.WeakKeyDictionary()
+        self._loops_lock = threading.Lock()
+        self.batches = 0
+        self.items = 0
+
+    def _loop_state(self, loop):
+        with self._loops_lock:
+            state = self._loops.get(loop)
+            if state is None:
+                state = self._loops[loop] = ({}, {})
+        return state
+
+    async def submit(self, key, item):
+        if self.window <= 0 or self.max_batch <= 1:
+            return (await self.handler(key, [item]))[0]
+        loop = asyncio.get_running_loop()
+        pending, timers = self._loop_state(loop)
+        future = loop.create_future()
+        batch = pending.setdefault(key, [])
+        batch.append((item, future))
+        if len(batch) >= self.max_batch:
+            self._flush(pending, timers, key)
+        elif key not in timers:
+            timers[key] = loop.call_later(self.window, self._flush, pending, timers, key)
+        return await future
+
+    def _flush(self, pending, timers, key):
+        timer = timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+        batch = pending.pop(key, None)
+        if batch:
+            asyncio.ensure_future(self._run(key, batch))
+
+    async def _run(self, key, batch):
+        self.batches += 1
+        self.items += len(batch)
+        try:
+            results = await self.handler(key, [item for item, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    def stats(self):
+        return {"batches": self.batches, "items": self.items,
+                "mean_batch": self.items / self.batches if self.batches else 0.0}
+
+
+def batch_settings():
+    """
+    Window and size limit from QUERY_BATCH_WINDOW_MS (0 disables batching)
+    and QUERY_BATCH_MAX.
+    """
+    return (float(os.getenv("QUERY_BATCH_WINDOW_MS", str(DEFAULT_WINDOW_MS))),
+            int(os.getenv("QUERY_BATCH_MAX", str(DEFAULT_MAX_BATCH))))
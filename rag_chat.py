@@ -1,45 +1,43 @@
-import os
+import re
 import time
-from google.genai import Client
+import asyncio
 from dotenv import load_dotenv
-from vector_store import blind_search
+from vector_store import blind_search, blind_search_async, get_store
+from embedders import get_api_semaphore, get_client, is_rate_limit, rate_limit_backoff
+from answer_cache import get_answer_cache, get_semantic_cache
+from context_assembler import context_settings, pack_context
+from metrics import span, record_prompt
 
 # Load environment variables from .env file
 load_dotenv()
 
-# Configure the Gemini API
-api_key = os.getenv("GOOGLE_API_KEY")
-client = None
-if not api_key:
-    print("Warning: GOOGLE_API_KEY not found in environment variables.")
-else:
-    try:
-        client = Client(api_key=api_key)
-    except Exception as e:
-        print(f"Error initializing Gemini Client: {e}")
+RATE_LIMIT_MESSAGE = "DETECTIVE LOG: I've hit the Gemini rate limit multiple times. Please wait a minute before asking another question."
+# First retry delay after a generation 429; doubles per attempt, with jitter
+GENERATE_BACKOFF_SECONDS = 5
+
+# Inline citations the prompt asks for, e.g. [witness_sarah.txt]
+CITATION_PATTERN = re.compile(r"\[([^\[\]]+?\.txt)\]")
 
 def get_gemini_client():
+    # Shares the lazily created client with the embedders
+    client = get_client()
     if client is None:
         raise ValueError("Gemini Client not initialized. Check your GOOGLE_API_KEY.")
     return client
 
-def generate_response(query, retries=3):
+def build_prompt(query, results):
     """
-    Retrieves evidence and generates a response using Gemini with strict citations.
-    Includes exponential backoff retry logic for rate limits.
+    Formats retrieved evidence and the question into the detective prompt.
     """
-    # 1. Retrieve top 2-3 relevant documents
-    results = blind_search(query, n_results=3)
-    
-    # 2. Format context for the prompt
+    # Format context for the prompt
     context_entries = []
     for doc, meta in zip(results['documents'][0], results['metadatas'][0]):
         context_entries.append(f"SOURCE: {meta['source']}\nCONTENT: {doc.strip()}")
     
     retrieved_documents = "\n\n".join(context_entries)
     
-    # 3. Create Strong Prompt
-    prompt = f"""
+    # Create Strong Prompt
+    return f"""
 You are a smart detective assistant.
 Answer ONLY using the context below.
 Do not invent information.
@@ -56,91 +54,194 @@ Context:
 Question:
 {query}
     """
+
+def _error_message(error):
+    if is_rate_limit(error):
+        return RATE_LIMIT_MESSAGE
+    return f"Error connecting to AI Detective: {error}"
+
+def _store_version(store):
+    return store.version if store is not None else None
+
+def retrieve(query, n_results=3, case_id=None):
+    """
+    Retrieves n_results times CONTEXT_POOL_FACTOR candidates and packs them
+    into deduplicated, MMR-ordered passages within the context token budget.
+    """
+    _, pool_factor, _ = context_settings()
+    with span("retrieve"):
+        results = blind_search(query, n_results=n_results * pool_factor, case_id=case_id)
+    with span("context_pack"):
+        return pack_context(get_store(), results, n_results=n_results)
+
+async def retrieve_async(query, n_results=3, case_id=None):
+    _, pool_factor, _ = context_settings()
+    with span("retrieve"):
+        results = await blind_search_async(query, n_results=n_results * pool_factor, case_id=case_id)
+    with span("context_pack"):
+        return await asyncio.to_thread(lambda: pack_context(get_store(), results, n_results=n_results))
+
+def answer_question(query, n_results=3, retries=3, case_id=None):
+    """
+    Retrieves evidence once and generates a cited answer from it.
+    Returns the answer together with the retrieval results it was grounded on.
+    Answers are cached per index version, so a reindex invalidates them.
+    case_id restricts retrieval to that case's evidence.
+    """
+    cache = get_answer_cache()
+    version = _store_version(get_store())
+    key = cache.key(version, query, n_results, case_id)
+    return cache.get_or_compute(key, lambda: _answer_question(query, n_results, retries, version, case_id))
+
+def _answer_question(query, n_results, retries, version, case_id=None):
+    # 1. Retrieve and pack the most relevant, non-redundant evidence
+    results = retrieve(query, n_results, case_id)
+
+    # A paraphrase of a recent question over the same evidence reuses its answer
+    semantic = get_semantic_cache()
+    cached = semantic.get(version, results)
+    if cached is not None:
+        return {"response": cached, "results": results}
+    
+    # 2. Build the prompt from exactly those results
+    with span("prompt_build"):
+        prompt = build_prompt(query, results)
     
-    delay = 5
     for attempt in range(retries):
         try:
             gemini_client = get_gemini_client()
-            response = gemini_client.models.generate_content(
-                model='gemini-2.0-flash', contents=prompt
-            )
-            return response.text.strip()
+            with span("generate"):
+                response = gemini_client.models.generate_content(
+                    model='gemini-2.0-flash', contents=prompt
+                )
+            record_prompt("chat", prompt, response)
+            semantic.put(version, results, response.text.strip())
+            return {"response": response.text.strip(), "results": results}
 
         except Exception as e:
-            error_str = str(e)
-            print(f"Gemini Error in generate_response: {error_str}")
-            if "429" in error_str or "RESOURCE_EXHAUSTED" in error_str:
-                if attempt < retries - 1:
-                    print(f"Rate limit hit. Waiting {delay} seconds (Attempt {attempt + 1})...")
-                    time.sleep(delay)
-                    delay *= 2
-                    continue
-                else:
-                    return "DETECTIVE LOG: I've hit the Gemini rate limit multiple times. Please wait a minute before asking another question."
-            return f"Error connecting to AI Detective: {error_str}"
-
-
-def extract_timeline(retries=3):
+            print(f"Gemini Error in generate_response: {e}")
+            delay = rate_limit_backoff(e, attempt, retries, "generate", GENERATE_BACKOFF_SECONDS)
+            if delay is None:
+                return {"response": _error_message(e), "results": results, "error": True}
+            time.sleep(delay)
+
+async def answer_question_async(query, n_results=3, retries=3, case_id=None):
     """
-    Reads all text files in the evidence folder and uses Gemini to 
-    extract a chronological timeline of events.
-    Includes exponential backoff retry logic for rate limits.
+    Async counterpart of answer_question for the API: awaits the async Gemini
+    client and backs off with asyncio.sleep so other requests keep flowing.
+    Identical questions in flight at the same time share one upstream call.
     """
-    evidence_dir = "evidence"
-    all_content = []
-    
-    if not os.path.exists(evidence_dir):
-        return []
-
-    for filename in os.listdir(evidence_dir):
-        if filename.endswith(".txt"):
-            try:
-                with open(os.path.join(evidence_dir, filename), 'r', encoding='utf-8', errors='replace') as f:
-                    all_content.append(f"Source: {filename}\nContent: {f.read()}")
-            except Exception as e:
-                print(f"Error reading {filename} for timeline: {e}")
-
-    context_text = "\n\n---\n\n".join(all_content)
-    
-    prompt = f"""
-    Review the following cold case evidence and extract a chronological timeline of events.
-    For each event, provide:
-    1. A precise timestamp/date (as mentioned in the text).
-    2. A brief description of the event.
-    3. The source file name.
-    
-    EVIDENCE:
-    {context_text}
-    
-    Format your response as a valid JSON list of objects like this:
-    [
-      {{"time": "2023-10-14 21:00", "event": "Man in dark hoodie seen running", "source": "witness_sarah.txt"}},
-      ...
-    ]
-    Sort the events from oldest to newest. Return ONLY the JSON.
+    cache = get_answer_cache()
+    version = _store_version(await asyncio.to_thread(get_store))
+    key = cache.key(version, query, n_results, case_id)
+    return await cache.get_or_compute_async(
+        key, lambda: _answer_question_async(query, n_results, retries, version, case_id))
+
+async def _answer_question_async(query, n_results, retries, version, case_id=None):
+    results = await retrieve_async(query, n_results, case_id)
+    semantic = get_semantic_cache()
+    cached = semantic.get(version, results)
+    if cached is not None:
+        return {"response": cached, "results": results}
+    with span("prompt_build"):
+        prompt = build_prompt(query, results)
+
+    for attempt in range(retries):
+        try:
+            gemini_client = get_gemini_client()
+            with span("generate"):
+                async with get_api_semaphore():
+                    response = await gemini_client.aio.models.generate_content(
+                        model='gemini-2.0-flash', contents=prompt
+                    )
+            record_prompt("chat", prompt, response)
+            semantic.put(version, results, response.text.strip())
+            return {"response": response.text.strip(), "results": results}
+
+        except Exception as e:
+            print(f"Gemini Error in answer_question_async: {e}")
+            delay = rate_limit_backoff(e, attempt, retries, "generate", GENERATE_BACKOFF_SECONDS)
+            if delay is None:
+                return {"response": _error_message(e), "results": results, "error": True}
+            await asyncio.sleep(delay)
+
+def extract_citations(text):
     """
-    
-    delay = 5
+    Returns the distinct source filenames cited in an answer, in order.
+    """
+    citations = []
+    for name in CITATION_PATTERN.findall(text):
+        if name not in citations:
+            citations.append(name)
+    return citations
+
+async def stream_answer(query, n_results=3, retries=3, case_id=None):
+    """
+    Streams an answer as (event, payload) pairs: "sources" as soon as retrieval
+    finishes, then one "token" per streamed text fragment, then "done" with the
+    full answer and its citations. Failures end the stream with an "error".
+    A cached answer is replayed as a single token.
+    """
+    cache = get_answer_cache()
+    version = _store_version(await asyncio.to_thread(get_store))
+    key = cache.key(version, query, n_results, case_id)
+    cached = cache.get(key)
+    if cached is not None:
+        yield "sources", cached["results"]
+        yield "token", cached["response"]
+        yield "done", {"response": cached["response"], "citations": extract_citations(cached["response"])}
+        return
+
+    results = await retrieve_async(query, n_results, case_id)
+    yield "sources", results
+    semantic = get_semantic_cache()
+    similar = semantic.get(version, results)
+    if similar is not None:
+        yield "token", similar
+        yield "done", {"response": similar, "citations": extract_citations(similar)}
+        return
+    with span("prompt_build"):
+        prompt = build_prompt(query, results)
+
     for attempt in range(retries):
+        parts = []
         try:
             gemini_client = get_gemini_client()
-            response = gemini_client.models.generate_content(
-                model='gemini-2.0-flash', contents=prompt
-            )
-
-            # Clean potential markdown wrapping
-            json_text = response.text.strip().replace('```json', '').replace('```', '')
-            import json
-            return json.loads(json_text)
+            with span("generate"):
+                async with get_api_semaphore():
+                    stream = await gemini_client.aio.models.generate_content_stream(
+                        model='gemini-2.0-flash', contents=prompt
+                    )
+                    async for chunk in stream:
+                        if chunk.text:
+                            parts.append(chunk.text)
+                            yield "token", chunk.text
+            record_prompt("chat_stream", prompt)
+            answer = "".join(parts).strip()
+            cache.put(key, {"response": answer, "results": results})
+            semantic.put(version, results, answer)
+            yield "done", {"response": answer, "citations": extract_citations(answer)}
+            return
+
         except Exception as e:
-            error_str = str(e)
-            print(f"Gemini Error in extract_timeline: {error_str}")
-            if ("429" in error_str or "RESOURCE_EXHAUSTED" in error_str) and attempt < retries - 1:
-                print(f"Timeline extraction hit rate limit. Retrying in {delay}s...")
-                time.sleep(delay)
-                delay *= 2
-                continue
-            return []
+            print(f"Gemini Error in stream_answer: {e}")
+            # Only retry if nothing has been sent yet, otherwise the client
+            # would see the answer restart mid-stream
+            if parts:
+                yield "error", {"message": f"Error connecting to AI Detective: {e}"}
+                return
+            delay = rate_limit_backoff(e, attempt, retries, "generate", GENERATE_BACKOFF_SECONDS)
+            if delay is None:
+                yield "error", {"message": _error_message(e)}
+                return
+            await asyncio.sleep(delay)
+
+def generate_response(query, retries=3):
+    """
+    Retrieves evidence and generates a response using Gemini with strict citations.
+    Includes exponential backoff retry logic for rate limits.
+    """
+    return answer_question(query, retries=retries)["response"]
 
 
 def main():
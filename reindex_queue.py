@@ -0,0 +1,131 @@
+import os
+import time
+import threading
+import traceback
+
+DEFAULT_DEBOUNCE_SECONDS = 2.0
+
+
+def summarize_report(report):
+    """
+    A build report with its per-file name lists replaced by their lengths,
+    small enough to send on every status poll.
+    """
+    if report is None:
+        return None
+    return {key: len(value) if isinstance(value, list) else value for key, value in report.items()}
+
+
+class ReindexQueue:
+    """
+    Runs reindex jobs on one background worker. Requests that arrive while
+    a run is queued or in progress collapse into a single follow-up run,
+    started once no new request has come in for `debounce` seconds.
+    The job is called as job(progress) and reports through
+    progress(stage, report) as build_vector_store does.
+    """
+
+    def __init__(self, job, debounce=DEFAULT_DEBOUNCE_SECONDS, expected_files=None):
+        self.job = job
+        self.debounce = debounce
+        self.expected_files = expected_files
+        self._condition = threading.Condition()
+        self._worker = None
+        self._pending = False
+        self._last_request = 0.0
+        self._status = {
+            "state": "idle",
+            "requests": 0,
+            "coalesced": 0,
+            "runs": 0,
+            "stage": None,
+            "started_at": None,
+            "finished_at": None,
+            "files_seen": 0,
+            "expected_files": None,
+            "total_chunks": 0,
+            "embedded_chunks": 0,
+            "eta_seconds": None,
+            "last_report": None,
+            "last_error": None,
+        }
+
+    def request(self):
+        """
+        Queues a reindex and returns the current status.
+        """
+        with self._condition:
+            self._status["requests"] += 1
+            if self._pending:
+                self._status["coalesced"] += 1
+            self._pending = True
+            self._last_request = time.monotonic()
+            if self._status["state"] == "idle":
+                self._status["state"] = "queued"
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="reindex", daemon=True)
+                self._worker.start()
+            self._condition.notify()
+        return self.status()
+
+    def status(self):
+        with self._condition:
+            return dict(self._status, pending=self._pending)
+
+    def _progress(self, stage, report):
+        with self._condition:
+            status = self._status
+            status["stage"] = stage
+            status["files_seen"] = report.get("files_seen", 0)
+            status["total_chunks"] = report["total_chunks"]
+            status["embedded_chunks"] = report["embedded_chunks"]
+            expected = status["expected_files"]
+            elapsed = time.time() - status["started_at"]
+            # Files are the only size known up front; chunks stream in
+            if stage == "embedding" and expected and status["files_seen"]:
+                done = min(1.0, status["files_seen"] / expected)
+                status["eta_seconds"] = round(elapsed * (1 - done) / done, 1)
+            elif stage == "indexing":
+                status["eta_seconds"] = None
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._pending:
+                    self._condition.wait()
+                # Debounce: wait until requests stop arriving
+                while True:
+                    remaining = self._last_request + self.debounce - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                self._pending = False
+                self._status.update(state="running", stage="starting", started_at=time.time(),
+                                    finished_at=None, files_seen=0, total_chunks=0,
+                                    embedded_chunks=0, eta_seconds=None,
+                                    expected_files=self.expected_files() if self.expected_files else None)
+                self._status["runs"] += 1
+
+            report = None
+            error = None
+            try:
+                report = self.job(self._progress)
+            except Exception as e:
+                print(f"CRITICAL: Background re-indexing failed: {e}")
+                print(traceback.format_exc())
+                error = str(e)
+
+            with self._condition:
+                self._status.update(state="queued" if self._pending else "idle", stage=None,
+                                    finished_at=time.time(), eta_seconds=None)
+                if error is not None:
+                    self._status["last_error"] = {"message": error, "at": time.time()}
+                else:
+                    self._status["last_report"] = summarize_report(report)
+
+
+def count_evidence_files(directory="evidence"):
+    try:
+        return sum(1 for name in os.listdir(directory) if name.endswith(".txt"))
+    except FileNotFoundError:
+        return 0
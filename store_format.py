@@ -0,0 +1,476 @@
+"""
+On-disk layout of the vector store.
+
+A store is a directory of immutable generations plus a CURRENT pointer:
+
+    vector_store/
+        CURRENT              name of the live generation, replaced atomically
+        gen-<version>/
+            index.faiss      native FAISS index (flat, HNSW, IVF or IVF-PQ); label i is row i,
+                             unless the index was extended from an earlier generation
+            row_labels.npy   int64 index label per row          } only in extended
+            label_rows.npy   int64 row per index label, -1 for  } generations
+                             rows removed since the last full index build
+            vectors.f32      raw float32 vectors, row-aligned, for rebuilds and re-ranking
+            ids.npy          int64 chunk ID per row
+            sources.npy      int32 index into meta.json "sources" per row
+            cases.npy        int32 index into meta.json "cases" per row
+            offsets.npy      int64 character offset of the chunk in its file
+            doc_offsets.npy  int64 byte offsets into documents.bin (rows + 1)
+            documents.bin    UTF-8 chunk texts, back to back
+            bm25_*           inverted index for lexical search (see lexical_index)
+            meta.json        version, sources, cases, manifest, embedding model
+
+Everything is opened read-only with mmap, so several workers share the
+same pages through the OS cache and only the top-k texts of a search are
+ever decoded.
+"""
+import os
+import json
+import mmap
+import time
+import shutil
+import pickle
+from array import array
+from ann_index import add_rows, build_index, read_flags, resolve_index
+from lexical_index import LexicalIndex, LexicalIndexWriter
+
+DEFAULT_CASE_ID = "Uncategorized"
+
+CURRENT_FILE = "CURRENT"
+INDEX_FILE = "index.faiss"
+DOCUMENTS_FILE = "documents.bin"
+VECTORS_FILE = "vectors.f32"
+META_FILE = "meta.json"
+
+# Generations kept on disk besides the live one, for readers still using them
+KEEP_GENERATIONS = 1
+# Unfinished builds are only reaped once nothing in them has changed for
+# this long, so a build still running in another process is left alone
+STALE_BUILD_SECONDS = 6 * 3600
+
+# A build extends the previous generation's index, adding only new rows,
+# until removed plus added labels since its last full build exceed this share
+DEFAULT_REBUILD_DRIFT = 0.2
+
+
+def rebuild_drift():
+    return float(os.getenv("VECTOR_INDEX_REBUILD_DRIFT", str(DEFAULT_REBUILD_DRIFT)))
+
+
+class StoreGeneration:
+    """
+    Read-only view of one published generation.
+    """
+
+    def __init__(self, path):
+        import numpy as np
+        import faiss
+
+        self.path = path
+        with open(os.path.join(path, META_FILE), 'r', encoding='utf-8') as f:
+            self.meta = json.load(f)
+        self.version = self.meta["version"]
+        self.sources = self.meta["sources"]
+        self.manifest = self.meta["manifest"]
+        self.index_type = self.meta.get("index_type", "flat")
+        self.index = faiss.read_index(os.path.join(path, INDEX_FILE), read_flags(self.index_type))
+        # Generations written before vectors.f32 existed fall back to the index
+        self.vectors = None
+        vectors_path = os.path.join(path, VECTORS_FILE)
+        if os.path.exists(vectors_path) and self.meta.get("count"):
+            self.vectors = np.memmap(vectors_path, dtype='float32', mode='r',
+                                     shape=(self.meta["count"], self.meta["dimension"]))
+        self.ids = np.load(os.path.join(path, "ids.npy"), mmap_mode='r')
+        self.source_rows = np.load(os.path.join(path, "sources.npy"), mmap_mode='r')
+        # Generations written before per-chunk case IDs can't be filtered by case
+        self.cases = self.meta.get("cases")
+        self.case_column = None
+        if self.cases is not None:
+            self.case_column = np.load(os.path.join(path, "cases.npy"), mmap_mode='r')
+        self._case_rows = {}
+        # Extended indexes label vectors independently of rows
+        self.row_labels = None
+        self.label_rows = None
+        if self.meta.get("labelled"):
+            self.row_labels = np.load(os.path.join(path, "row_labels.npy"), mmap_mode='r')
+            self.label_rows = np.load(os.path.join(path, "label_rows.npy"), mmap_mode='r')
+        self._live_selector = None
+        self.offsets = np.load(os.path.join(path, "offsets.npy"), mmap_mode='r')
+        self.doc_offsets = np.load(os.path.join(path, "doc_offsets.npy"), mmap_mode='r')
+        self.lexical = LexicalIndex(path) if LexicalIndex.exists(path) else None
+        self._documents = None
+        if os.path.getsize(os.path.join(path, DOCUMENTS_FILE)) > 0:
+            with open(os.path.join(path, DOCUMENTS_FILE), 'rb') as f:
+                self._documents = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def document(self, row):
+        start, end = int(self.doc_offsets[row]), int(self.doc_offsets[row + 1])
+        if start == end:
+            return ""
+        return self._documents[start:end].decode('utf-8')
+
+    def reconstruct(self, rows):
+        """
+        Returns the stored float32 vectors of the given rows.
+        """
+        import numpy as np
+
+        rows = np.asarray(rows, dtype='int64')
+        if self.vectors is not None:
+            return np.asarray(self.vectors[rows])
+        return self.index.reconstruct_batch(rows)
+
+    def metadata(self, row):
+        meta = {"source": self.sources[int(self.source_rows[row])], "offset": int(self.offsets[row])}
+        if self.case_column is not None:
+            meta["case_id"] = self.cases[int(self.case_column[row])]
+        return meta
+
+    def case_rows(self, case_id):
+        """
+        Sorted int64 rows belonging to a case (empty for an unknown case),
+        or None if this generation has no case column. Cached per case;
+        generations never change once published.
+        """
+        import numpy as np
+
+        if self.case_column is None:
+            return None
+        rows = self._case_rows.get(case_id)
+        if rows is None:
+            try:
+                code = self.cases.index(case_id)
+                rows = np.flatnonzero(np.asarray(self.case_column) == code).astype('int64')
+            except ValueError:
+                rows = np.empty(0, dtype='int64')
+            self._case_rows[case_id] = rows
+        return rows
+
+    def labels_for(self, rows):
+        """
+        Index labels of the given rows.
+        """
+        import numpy as np
+
+        rows = np.asarray(rows, dtype='int64')
+        if self.row_labels is None:
+            return rows
+        return np.asarray(self.row_labels[rows])
+
+    def rows_for_labels(self, labels):
+        """
+        Rows of the labels a FAISS search returned, dropping misses and
+        labels of removed rows.
+        """
+        if self.label_rows is None:
+            return [int(label) for label in labels if label != -1]
+        rows = (int(self.label_rows[label]) for label in labels if label != -1)
+        return [row for row in rows if row != -1]
+
+    def selector(self, rows=None):
+        """
+        FAISS ID selector limiting a search to these rows, or to all live
+        rows; None when the whole index is live and no rows are given.
+        """
+        import numpy as np
+        import faiss
+
+        if rows is not None:
+            return faiss.IDSelectorBatch(self.labels_for(rows))
+        if self.label_rows is None or self.index.ntotal == len(self.ids):
+            return None
+        if self._live_selector is None:
+            removed = faiss.IDSelectorBatch(np.flatnonzero(np.asarray(self.label_rows) == -1).astype('int64'))
+            # IDSelectorNot doesn't own its argument, so keep both alive
+            self._live_selector = (faiss.IDSelectorNot(removed), removed)
+        return self._live_selector[0]
+
+    def id_to_row(self):
+        """
+        Maps chunk IDs to rows; only builds need this.
+        """
+        return dict(zip(self.ids.tolist(), range(len(self.ids))))
+
+
+class GenerationWriter:
+    """
+    Writes a new generation into a temp directory, row by row. Texts and
+    lexical postings go straight to disk; only fixed-size per-row columns
+    are kept in memory.
+    """
+
+    def __init__(self, store_path, version):
+        self.store_path = store_path
+        self.version = version
+        self.name = f"gen-{version}"
+        self.tmp_path = os.path.join(store_path, f"{self.name}.tmp")
+        os.makedirs(self.tmp_path)
+        self._documents = open(os.path.join(self.tmp_path, DOCUMENTS_FILE), 'wb')
+        self._vectors = open(os.path.join(self.tmp_path, VECTORS_FILE), 'wb')
+        self._doc_end = 0
+        self.dimension = None
+        self.vector_count = 0
+        self.ids = array('q')
+        self.base_rows = array('q')
+        self.source_rows = array('i')
+        self.case_column = array('i')
+        self.offsets = array('q')
+        self.doc_offsets = array('q', [0])
+        self.sources = []
+        self._source_index = {}
+        self.cases = []
+        self._case_index = {}
+        self.lexical = LexicalIndexWriter(self.tmp_path)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def add(self, chunk_id, source, offset, content, case_id=DEFAULT_CASE_ID, base_row=None):
+        """
+        Appends one row. base_row is the chunk's row in the generation the
+        build started from, if its vector was carried over.
+        """
+        if source not in self._source_index:
+            self._source_index[source] = len(self.sources)
+            self.sources.append(source)
+        if case_id not in self._case_index:
+            self._case_index[case_id] = len(self.cases)
+            self.cases.append(case_id)
+        self.lexical.add(len(self.ids), content)
+        data = content.encode('utf-8')
+        self._documents.write(data)
+        self._doc_end += len(data)
+        self.ids.append(chunk_id)
+        self.base_rows.append(-1 if base_row is None else base_row)
+        self.source_rows.append(self._source_index[source])
+        self.case_column.append(self._case_index[case_id])
+        self.offsets.append(offset)
+        self.doc_offsets.append(self._doc_end)
+
+    def add_vectors(self, vectors):
+        """
+        Appends float32 vectors for rows already added, in row order.
+        """
+        import numpy as np
+
+        vectors = np.ascontiguousarray(vectors, dtype='float32')
+        self.dimension = vectors.shape[1]
+        self._vectors.write(vectors.tobytes())
+        self.vector_count += len(vectors)
+
+    def _extension_labels(self, base, kind):
+        """
+        Index labels for this generation's rows if base's index can be
+        extended with just the new rows, or None if it must be rebuilt:
+        another index type, or too much drift since base's last full build.
+        """
+        import numpy as np
+
+        if base is None or base.index_type != kind or not base.index.ntotal:
+            return None
+        base_rows = np.frombuffer(self.base_rows, dtype='int64')
+        carried = base_rows >= 0
+        base_labels = base.index.ntotal
+        labels = base_labels + int(len(base_rows) - carried.sum())
+        built = base.meta.get("index_built_labels", base_labels)
+        stale = (labels - len(base_rows)) + (labels - built)
+        if stale > rebuild_drift() * labels:
+            return None
+        row_labels = np.empty(len(base_rows), dtype='int64')
+        row_labels[carried] = base.labels_for(base_rows[carried])
+        row_labels[~carried] = np.arange(base_labels, labels)
+        return row_labels
+
+    def finish(self, meta, index_type=None, base=None):
+        """
+        Flushes all columns and writes the FAISS index. If base (the
+        generation the build started from) has an index of the right type,
+        it's extended with only the new rows; otherwise the index is built
+        from the vectors file. Returns the index type.
+        """
+        import numpy as np
+        import faiss
+
+        if self.vector_count != len(self.ids):
+            raise ValueError(f"{len(self.ids)} rows but {self.vector_count} vectors written.")
+        for f in (self._documents, self._vectors):
+            f.flush()
+            os.fsync(f.fileno())
+            f.close()
+        np.save(os.path.join(self.tmp_path, "ids.npy"), np.frombuffer(self.ids, dtype='int64'))
+        np.save(os.path.join(self.tmp_path, "sources.npy"), np.frombuffer(self.source_rows, dtype='int32'))
+        np.save(os.path.join(self.tmp_path, "cases.npy"), np.frombuffer(self.case_column, dtype='int32'))
+        np.save(os.path.join(self.tmp_path, "offsets.npy"), np.frombuffer(self.offsets, dtype='int64'))
+        np.save(os.path.join(self.tmp_path, "doc_offsets.npy"), np.frombuffer(self.doc_offsets, dtype='int64'))
+        if len(self.ids):
+            vectors = np.memmap(os.path.join(self.tmp_path, VECTORS_FILE), dtype='float32', mode='r',
+                                shape=(len(self.ids), self.dimension))
+        else:
+            # An empty file can't be memory-mapped
+            vectors = np.empty((0, self.dimension), dtype='float32')
+        kind, params = resolve_index(len(self.ids), self.dimension, index_type)
+        row_labels = self._extension_labels(base, kind)
+        if row_labels is None:
+            index, kind, params = build_index(vectors, index_type)
+            labelled = {"index_built_labels": len(self.ids)}
+        else:
+            # Carried rows keep their labels; new rows are appended after the
+            # base's labels, so rows removed since stay in the index unreachable
+            index = faiss.read_index(os.path.join(base.path, INDEX_FILE))
+            add_rows(index, vectors, np.flatnonzero(np.frombuffer(self.base_rows, dtype='int64') < 0))
+            params = base.meta.get("index_params") or params
+            label_rows = np.full(index.ntotal, -1, dtype='int64')
+            label_rows[row_labels] = np.arange(len(row_labels))
+            np.save(os.path.join(self.tmp_path, "row_labels.npy"), row_labels)
+            np.save(os.path.join(self.tmp_path, "label_rows.npy"), label_rows)
+            labelled = {"labelled": True,
+                        "index_built_labels": base.meta.get("index_built_labels", base.index.ntotal)}
+            print(f"Extended the {kind} index with {index.ntotal - base.index.ntotal} new vectors.")
+        del vectors
+        faiss.write_index(index, os.path.join(self.tmp_path, INDEX_FILE))
+        self.lexical.finish()
+        meta = dict(meta, version=self.version, sources=self.sources, cases=self.cases, count=len(self.ids),
+                    dimension=self.dimension, index_type=kind, index_params=params, **labelled)
+        with open(os.path.join(self.tmp_path, META_FILE), 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        return kind
+
+    def abort(self):
+        for f in (self._documents, self._vectors):
+            if not f.closed:
+                f.close()
+        shutil.rmtree(self.tmp_path, ignore_errors=True)
+
+    def publish(self):
+        """
+        Moves the finished generation into place and flips CURRENT to it.
+        """
+        os.rename(self.tmp_path, os.path.join(self.store_path, self.name))
+        # Per-generation temp name, so concurrent publishers never share it
+        pointer_tmp = os.path.join(self.store_path, f"{CURRENT_FILE}.{self.name}.tmp")
+        with open(pointer_tmp, 'w', encoding='utf-8') as f:
+            f.write(self.name)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(pointer_tmp, os.path.join(self.store_path, CURRENT_FILE))
+        collect_garbage(self.store_path)
+
+
+def current_generation_path(store_path):
+    """
+    Returns the live generation directory, or None if nothing is published.
+    """
+    try:
+        with open(os.path.join(store_path, CURRENT_FILE), 'r', encoding='utf-8') as f:
+            name = f.read().strip()
+    except FileNotFoundError:
+        return None
+    return os.path.join(store_path, name) if name else None
+
+def pointer_mtime(store_path):
+    try:
+        return os.stat(os.path.join(store_path, CURRENT_FILE)).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+def _is_stale(path, now):
+    """
+    True if neither path nor anything directly inside it has been modified
+    for STALE_BUILD_SECONDS.
+    """
+    try:
+        latest = os.stat(path).st_mtime
+        if os.path.isdir(path):
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    latest = max(latest, entry.stat().st_mtime)
+    except FileNotFoundError:
+        # Published or removed meanwhile
+        return False
+    return now - latest > STALE_BUILD_SECONDS
+
+def collect_garbage(store_path):
+    """
+    Deletes all but the newest old generations, plus temp directories and
+    pointer files left behind by builds older than the live generation that
+    have stopped writing.
+    """
+    live = os.path.basename(current_generation_path(store_path) or "")
+    live_version = int(live[4:]) if live else 0
+    now = time.time()
+    generations = []
+    for name in os.listdir(store_path):
+        if name.startswith(f"{CURRENT_FILE}.") and name.endswith(".tmp"):
+            if _is_stale(os.path.join(store_path, name), now):
+                try:
+                    os.remove(os.path.join(store_path, name))
+                except FileNotFoundError:
+                    pass
+            continue
+        if not name.startswith("gen-"):
+            continue
+        if name.endswith(".tmp"):
+            path = os.path.join(store_path, name)
+            if int(name[4:-4]) < live_version and _is_stale(path, now):
+                shutil.rmtree(path, ignore_errors=True)
+        elif name != live:
+            generations.append(name)
+    generations.sort(key=lambda name: int(name[4:]))
+    doomed = generations[:-KEEP_GENERATIONS] if KEEP_GENERATIONS else generations
+    for name in doomed:
+        shutil.rmtree(os.path.join(store_path, name), ignore_errors=True)
+
+def migrate_pickle_store(pickle_path, store_path, embedding_model, chunk_step):
+    """
+    One-time conversion of a vector_store.pkl into a store directory.
+    Chunk IDs and offsets are recovered from chunk order, so the next build
+    reuses the migrated vectors instead of re-embedding them. Each source's
+    case ID is read from the header line of its first chunk, as ingest does.
+    """
+    import numpy as np
+    from ingest import make_chunk_id, parse_case_id
+
+    with open(pickle_path, "rb") as f:
+        data = pickle.load(f)
+    index = data["index"]
+
+    if isinstance(data["documents"], list):
+        # Original layout: positional lists, chunks of a file in order
+        rows = list(range(len(data["documents"])))
+        documents = data["documents"]
+        sources = [meta["source"] for meta in data["metadatas"]]
+        vectors = index.reconstruct_n(0, index.ntotal) if index.ntotal else None
+    else:
+        # Manifest layout: ID-keyed dicts over an IndexIDMap2
+        rows = [cid for entry in data["manifest"].values() for cid in entry["chunk_ids"] if cid in data["documents"]]
+        documents = [data["documents"][cid] for cid in rows]
+        sources = [data["metadatas"][cid]["source"] for cid in rows]
+        vectors = np.vstack([index.reconstruct(int(cid)) for cid in rows]) if rows else None
+
+    version = data.get("version", int(os.stat(pickle_path).st_mtime_ns))
+    os.makedirs(store_path, exist_ok=True)
+    writer = GenerationWriter(store_path, version)
+    try:
+        ordinals = {}
+        case_ids = {}
+        for content, source in zip(documents, sources):
+            if source not in ordinals:
+                # The offset-0 chunk starts with the file's header line
+                case_ids[source] = parse_case_id(content.split("\n", 1)[0])
+            offset = ordinals.get(source, 0) * chunk_step
+            ordinals[source] = ordinals.get(source, 0) + 1
+            writer.add(make_chunk_id(source, offset, content), source, offset, content, case_ids[source])
+        if vectors is not None:
+            writer.add_vectors(vectors)
+        # Legacy hashes are unknown, so every file is re-checked on the next
+        # build; matching chunk IDs keep their vectors.
+        writer.finish({"manifest": {}, "embedding_model": embedding_model})
+        writer.publish()
+    except Exception:
+        writer.abort()
+        raise
+    print(f"Migrated {pickle_path} to {store_path}/ ({len(writer)} chunks).")
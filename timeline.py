@@ -0,0 +1,200 @@
+import os
+import json
+import asyncio
+import threading
+from datetime import datetime
+from ingest import content_hash, parse_case_id
+from rag_chat import get_gemini_client, GENERATE_BACKOFF_SECONDS
+from embedders import get_api_semaphore, rate_limit_backoff
+from metrics import span, record_prompt
+
+TIMELINE_CACHE_PATH = "timeline_cache.json"
+TIMELINE_MODEL = 'gemini-2.0-flash'
+
+# Per-file timeline events keyed by file content hash, mirrored to disk
+_timeline_cache = None
+_timeline_cache_lock = threading.Lock()
+
+# Formats tried, in order, when sorting events by their timestamp
+_TIME_FORMATS = [
+    "%Y-%m-%d %H:%M:%S",
+    "%Y-%m-%d %H:%M",
+    "%Y-%m-%dT%H:%M:%S",
+    "%Y-%m-%dT%H:%M",
+    "%Y-%m-%d",
+    "%B %d, %Y %I:%M %p",
+    "%B %d, %Y %H:%M",
+    "%B %d, %Y",
+    "%b %d, %Y",
+    "%m/%d/%Y %H:%M",
+    "%m/%d/%Y",
+]
+
+def _get_timeline_cache():
+    global _timeline_cache
+    if _timeline_cache is None:
+        try:
+            with open(TIMELINE_CACHE_PATH, 'r', encoding='utf-8') as f:
+                _timeline_cache = json.load(f)
+        except (FileNotFoundError, ValueError):
+            _timeline_cache = {}
+    return _timeline_cache
+
+def _save_timeline_cache(cache, live_hashes):
+    """
+    Writes the cache back to disk, dropping entries for files that no
+    longer exist so it doesn't grow without bound.
+    """
+    for key in [k for k in cache if k not in live_hashes]:
+        del cache[key]
+    tmp_path = f"{TIMELINE_CACHE_PATH}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(cache, f)
+    os.replace(tmp_path, TIMELINE_CACHE_PATH)
+
+def _read_timeline_evidence(evidence_dir="evidence"):
+    files = []
+
+    if not os.path.exists(evidence_dir):
+        return files
+
+    for filename in sorted(os.listdir(evidence_dir)):
+        if filename.endswith(".txt"):
+            try:
+                with open(os.path.join(evidence_dir, filename), 'r', encoding='utf-8', errors='replace') as f:
+                    content = f.read()
+                files.append({
+                    "source": filename,
+                    "content": content,
+                    "hash": content_hash(content),
+                    "case_id": parse_case_id(content.split("\n", 1)[0]),
+                })
+            except Exception as e:
+                print(f"Error reading {filename} for timeline: {e}")
+    return files
+
+def _timeline_prompt(source, content):
+    return f"""
+    Review the following cold case evidence file and extract a chronological timeline of events.
+    For each event, provide:
+    1. A precise timestamp/date (as mentioned in the text), written as "YYYY-MM-DD HH:MM" when the date is known.
+    2. A brief description of the event.
+    3. The source file name.
+
+    EVIDENCE:
+    Source: {source}
+    Content: {content}
+
+    Format your response as a valid JSON list of objects like this:
+    [
+      {{"time": "2023-10-14 21:00", "event": "Man in dark hoodie seen running", "source": "{source}"}},
+      ...
+    ]
+    Sort the events from oldest to newest. Return ONLY the JSON.
+    """
+
+def _parse_timeline(text):
+    # Clean potential markdown wrapping
+    json_text = text.strip().replace('```json', '').replace('```', '')
+    events = json.loads(json_text)
+    return events if isinstance(events, list) else []
+
+def _parse_event_time(value):
+    value = str(value).strip()
+    for fmt in _TIME_FORMATS:
+        try:
+            return datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+    return None
+
+def _merge_timelines(files, per_file_events):
+    """
+    Reduces per-file events into one timeline sorted by parsed timestamp.
+    Events whose time can't be parsed keep their file order at the end.
+    """
+    merged = []
+    for file, events in zip(files, per_file_events):
+        for event in events or []:
+            if isinstance(event, dict):
+                merged.append(dict(event, source=file["source"]))
+
+    def sort_key(item):
+        position, event = item
+        parsed = _parse_event_time(event.get("time", ""))
+        return (parsed is None, parsed or datetime.min, position)
+
+    return [event for _, event in sorted(enumerate(merged), key=sort_key)]
+
+def _select_files(files, case_id):
+    if not case_id or case_id == "All":
+        return files
+    # Same rule as case-scoped chat: the file's own case header
+    return [file for file in files if file["case_id"] == case_id]
+
+async def _file_timeline_async(file, retries=3):
+    """
+    Extracts one file's events, or returns None if Gemini failed.
+    """
+    prompt = _timeline_prompt(file["source"], file["content"])
+    for attempt in range(retries):
+        try:
+            gemini_client = get_gemini_client()
+            with span("timeline_generate"):
+                async with get_api_semaphore():
+                    response = await gemini_client.aio.models.generate_content(
+                        model=TIMELINE_MODEL, contents=prompt
+                    )
+            record_prompt("timeline", prompt, response)
+            return _parse_timeline(response.text)
+        except Exception as e:
+            print(f"Gemini Error in timeline extraction for {file['source']}: {e}")
+            delay = rate_limit_backoff(e, attempt, retries, "timeline", GENERATE_BACKOFF_SECONDS)
+            if delay is None:
+                return None
+            await asyncio.sleep(delay)
+
+def _store_results(all_files, files, results):
+    with _timeline_cache_lock:
+        cache = _get_timeline_cache()
+        updated = False
+        for file, events in zip(files, results):
+            # Failed extractions aren't cached so the next request retries them
+            if events is not None:
+                cache[file["hash"]] = events
+                updated = True
+        if updated:
+            _save_timeline_cache(cache, {file["hash"] for file in all_files})
+
+def extract_timeline(case_id=None, retries=3, with_failures=False):
+    """
+    Blocking wrapper around extract_timeline_async, for scripts.
+    """
+    return asyncio.run(extract_timeline_async(case_id, retries, with_failures))
+
+async def extract_timeline_async(case_id=None, retries=3, with_failures=False):
+    """
+    Builds a chronological timeline of events from the evidence folder.
+    Each file is extracted on its own and cached by content hash, so only
+    new or changed files cost a Gemini call; they are extracted in parallel,
+    bounded by the shared Gemini semaphore. Results are merged locally.
+    with_failures returns (timeline, number of files whose extraction failed).
+    """
+    with span("timeline_read"):
+        all_files = await asyncio.to_thread(_read_timeline_evidence)
+    files = _select_files(all_files, case_id)
+    cache = _get_timeline_cache()
+
+    pending = [file for file in files if file["hash"] not in cache]
+    results = []
+    if pending:
+        with span("timeline_extract"):
+            results = await asyncio.gather(*(_file_timeline_async(file, retries) for file in pending))
+        await asyncio.to_thread(_store_results, all_files, pending, results)
+
+    per_file_events = [cache.get(file["hash"], []) for file in files]
+    with span("timeline_merge"):
+        timeline = _merge_timelines(files, per_file_events)
+    if with_failures:
+        return timeline, sum(1 for events in results if events is None)
+    return timeline
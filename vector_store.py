@@ -1,144 +1,560 @@
 
 
+import asyncio
 import os
-import pickle
+import threading
 import time
-from google.genai import Client
+from collections import deque
 from dotenv import load_dotenv
+from embedders import (
+    EMBEDDING_MODEL,
+    EMBED_BATCH_SIZE,
+    get_embedder,
+    embedder_for,
+    is_rate_limit,
+)
+from ingest import CHUNK_SIZE, CHUNK_OVERLAP
+from ann_index import resolve_index, search_parameters
+from lexical_index import reciprocal_rank_fusion
+from micro_batch import MicroBatcher, batch_settings
+from metrics import span, EMBEDDED_CHUNKS, INDEX_VECTORS, INDEX_VERSION, SEARCH_FALLBACKS
+from store_format import (
+    StoreGeneration,
+    GenerationWriter,
+    current_generation_path,
+    pointer_mtime,
+    migrate_pickle_store,
+)
 
 load_dotenv()
 
-# Global variable for the client, initially None
-_client = None
+# Store directory; a legacy STORE_PATH + ".pkl" is migrated on first use
+STORE_PATH = "vector_store"
 
-def get_client():
+SEARCH_MODES = ("vector", "lexical", "hybrid")
+# Hybrid search fuses this many candidates per n_results from each ranking
+HYBRID_POOL_FACTOR = 4
+HYBRID_MIN_POOL = 20
+# After a query-embedding 429, searches skip the API for this long
+EMBEDDING_COOLDOWN_SECONDS = 30
+# Approximate indexes scan a case exactly when its vectors hold at most this
+# many floats (16 MB: ~5k rows at 768 dims); flat indexes and larger cases
+# use an ID selector, which avoids copying vectors out of the memmap
+CASE_EXACT_SEARCH_MAX_VALUES = 4_000_000
+
+# Process-wide handles on loaded stores, keyed by store path.
+# Each entry is replaced as a whole, so readers never see a partial swap.
+_stores = {}
+_stores_lock = threading.Lock()
+_reloading = set()
+# Serializes loads, so concurrent cold callers share one load per generation
+_load_lock = threading.Lock()
+_migration_lock = threading.Lock()
+_embedding_cooldown_until = 0.0
+# Coalesce concurrent async queries into batched embedding calls and searches
+_embed_batcher = None
+_search_batcher = None
+
+def _ensure_store(store_path):
+    """
+    Runs the one-time migration from a legacy <store_path>.pkl if the store
+    directory hasn't been created yet.
+    """
+    legacy_path = f"{store_path}.pkl"
+    if current_generation_path(store_path) is not None or not os.path.exists(legacy_path):
+        return
+    with _migration_lock:
+        if current_generation_path(store_path) is None:
+            migrate_pickle_store(legacy_path, store_path, EMBEDDING_MODEL, CHUNK_SIZE - CHUNK_OVERLAP)
+
+def _open_current(store_path):
+    _ensure_store(store_path)
+    path = current_generation_path(store_path)
+    return StoreGeneration(path) if path else None
+
+def build_vector_store(evidence_data, store_path=STORE_PATH, batch_size=EMBED_BATCH_SIZE, index_type=None,
+                       embedder=None, progress=None):
+    """
+    Embeds evidence text and stores it in a FAISS index with metadata.
+    evidence_data can be any iterable of chunks (e.g. ingest.iter_evidence);
+    it is consumed in one pass and embedded batch by batch as batches fill.
+    Chunks already in the live generation keep their vectors; only new ones
+    are embedded. The result is published as a new generation.
+    index_type is one of ann_index.INDEX_TYPES; by default it comes from
+    VECTOR_INDEX_TYPE or is chosen by corpus size.
+    embedder defaults to embedders.get_embedder() (EMBEDDING_BACKEND); its
+    name is recorded so searches embed queries with the same backend.
+    progress, if given, is called as progress(stage, report) after every
+    batch ("embedding") and before the index is built ("indexing").
+    Returns a report of what changed.
+    """
+    import numpy as np
+
+    embedder = embedder or get_embedder()
+    if not embedder.available():
+        print(f"Error: Embedding backend {embedder.name} not available. Skipping vector store build.")
+        return None
+
+    # Vectors from the live generation are reusable only if they came from
+    # the same model with the same dimensionality
+    old = _open_current(store_path)
+    reuse = old is not None and old.meta.get("embedding_model") == embedder.name
+    if reuse and embedder.dimension() != old.index.d:
+        print("Embedding dimension changed. Re-embedding the whole store.")
+        reuse = False
+    manifest = old.manifest if reuse else {}
+    # Generations without per-chunk case IDs are rewritten even if unchanged
+    has_cases = old is not None and old.case_column is not None
+    id_to_row = old.id_to_row() if reuse else {}
+
+    os.makedirs(store_path, exist_ok=True)
+    writer = GenerationWriter(store_path, time.time_ns())
+    report = {"added": [], "changed": [], "removed": [], "unchanged": [],
+              "total_chunks": 0, "embedded_chunks": 0, "removed_chunks": 0, "files_seen": 0}
+    new_manifest = {}
+    pending = []
+    pending_embeds = 0
+    reused = 0
+    # Groups of chunks whose new embeddings are in flight, oldest first. The
+    # window keeps the embedder's workers busy plus as many groups queued, so
+    # one slow batch never idles the others; groups are written in order.
+    window = deque()
+    window_size = embedder.concurrency * 2
+
+    def submit():
+        nonlocal pending_embeds
+        to_embed = [item['content'] for item, row in pending if row is None]
+        future = embedder.submit(to_embed) if to_embed else None
+        window.append((list(pending), len(to_embed), future))
+        pending.clear()
+        pending_embeds = 0
+
+    def drain():
+        group, embedded, future = window.popleft()
+        with span("build_embed"):
+            fresh = future.result() if future is not None else []
+        reused_rows = [row for _, row in group if row is not None]
+        with span("build_reuse"):
+            old_vectors = iter(old.reconstruct(reused_rows)) if reused_rows else iter(())
+        fresh = iter(fresh)
+        vectors = []
+        for item, row in group:
+            vectors.append(next(old_vectors) if row is not None else next(fresh))
+            writer.add(item['id'], item['source'], item['offset'], item['content'], item['case_id'], row)
+        writer.add_vectors(np.array(vectors).astype('float32'))
+        report["embedded_chunks"] += embedded
+        EMBEDDED_CHUNKS.inc(embedded)
+        report["files_seen"] = len(new_manifest)
+        if progress:
+            progress("embedding", report)
+
+    try:
+        for item in evidence_data:
+            source = item['source']
+            if source not in new_manifest:
+                new_manifest[source] = item['file_hash']
+                if source not in manifest:
+                    report["added"].append(source)
+                elif manifest[source] == item['file_hash']:
+                    report["unchanged"].append(source)
+                else:
+                    report["changed"].append(source)
+            report["total_chunks"] += 1
+
+            row = id_to_row.get(item['id'])
+            if row is None:
+                pending_embeds += 1
+            else:
+                reused += 1
+            pending.append((item, row))
+            # A group goes out once it holds a full batch of new chunks;
+            # reused chunks are cheap, but still bounded
+            if pending_embeds >= batch_size or len(pending) >= batch_size * 8:
+                submit()
+                if len(window) > window_size:
+                    drain()
+        if pending:
+            submit()
+        while window:
+            drain()
+
+        report["removed"] = [source for source in manifest if source not in new_manifest]
+        report["removed_chunks"] = (len(old) - reused) if old is not None else 0
+
+        if not new_manifest:
+            if old is None:
+                writer.abort()
+                return None
+            # Every evidence file is gone: an empty generation replaces the
+            # live one, so vectors of deleted files stop being served
+            writer.add_vectors(np.empty((0, embedder.dimension()), dtype='float32'))
+        # Compare with the type a build would actually produce, flat fallback included
+        same_index = (reuse and has_cases
+                      and resolve_index(len(old), old.index.d, index_type)[0] == old.index_type)
+        if same_index and not (report["added"] or report["changed"] or report["removed"]):
+            writer.abort()
+            print("Vector store is up to date. Nothing to embed.")
+            return report
+
+        if progress:
+            progress("indexing", report)
+        # The live index is extended with just the new rows when its type
+        # still fits; otherwise any index type (and a retrained quantizer) is
+        # built from the written vectors
+        with span("build_index"):
+            report["index_type"] = writer.finish({"manifest": new_manifest, "embedding_model": embedder.name},
+                                                 index_type, base=old if reuse else None)
+        with span("build_publish"):
+            writer.publish()
+    except Exception:
+        for _, _, future in window:
+            if future is not None:
+                future.cancel()
+        writer.abort()
+        raise
+    
+    print(f"Vector store updated: {len(report['added'])} added, {len(report['changed'])} changed, "
+          f"{len(report['removed'])} removed, {len(report['unchanged'])} unchanged files "
+          f"({report['embedded_chunks']} chunks embedded, {report['removed_chunks']} removed).")
+    return report
+
+def reload_store(store_path=STORE_PATH):
     """
-    Lazy loads the Gemini Client.
+    Opens the live generation and atomically swaps it in as the resident copy.
+    Returns the loaded store, or None if no store exists yet. Callers
+    arriving while a load is in progress wait for it and share its result.
     """
-    global _client
-    if _client is None:
-        from google.genai import Client
-        api_key = os.getenv("GOOGLE_API_KEY")
-        if not api_key:
-            print("Warning: GOOGLE_API_KEY not found in environment variables.")
+    with _load_lock:
+        # Read the pointer's mtime first: if a publish races with the load, the
+        # next get_store sees a newer mtime and reloads rather than missing it
+        mtime = pointer_mtime(store_path)
+        entry = _stores.get(store_path)
+        if entry is not None and mtime is not None and entry[1] == mtime:
+            # Loaded by another caller while this one waited
+            return entry[0]
+        store = _open_current(store_path)
+        if store is None:
             return None
+        if mtime is None:
+            mtime = pointer_mtime(store_path)
+        with _stores_lock:
+            _stores[store_path] = (store, mtime)
+    INDEX_VECTORS.set(store.index.ntotal, store=store_path)
+    INDEX_VERSION.set(store.version, store=store_path)
+    print(f"Vector store loaded (version {store.version}, {store.index.ntotal} vectors).")
+    return store
+
+def _reload_in_background(store_path):
+    def run():
         try:
-            _client = Client(api_key=api_key)
+            reload_store(store_path)
         except Exception as e:
-            print(f"Error initializing Gemini Client: {e}")
-            return None
-    return _client
+            print(f"Background vector store reload failed: {e}")
+        finally:
+            with _stores_lock:
+                _reloading.discard(store_path)
+
+    with _stores_lock:
+        if store_path in _reloading:
+            return
+        _reloading.add(store_path)
+    threading.Thread(target=run, daemon=True).start()
+
+def get_store(store_path=STORE_PATH):
+    """
+    Returns the resident store, loading it on first use. If a newer
+    generation has been published since, the old copy keeps serving while
+    the new one is loaded in the background.
+    """
+    entry = _stores.get(store_path)
+    if entry is None:
+        return reload_store(store_path)
+    store, mtime = entry
+    current = pointer_mtime(store_path)
+    if current is not None and current != mtime:
+        _reload_in_background(store_path)
+    return store
 
-def build_vector_store(evidence_data, store_path="vector_store.pkl"):
+def warm_store(store_path=STORE_PATH):
     """
-    Embeds evidence text using Gemini and stores it in a FAISS index with metadata.
+    Loads the store and runs a throwaway search, so index pages are resident
+    and the query embedder (SDK import, local model) is ready before the
+    first real request. Returns the store, or None if none is built yet.
     """
-    if not evidence_data:
+    import numpy as np
+
+    store = get_store(store_path)
+    if store is None:
         return None
+    if len(store):
+        vector_rankings(store, np.zeros((1, store.index.d), dtype='float32'), 1)
+        if store.lexical is not None:
+            store.lexical.search("warm up", 1)
+    _query_embedder(store).available()
+    return store
 
-    documents = [item['content'] for item in evidence_data]
-    metadatas = [{"source": item['source']} for item in evidence_data]
-    
-    # Create embeddings using Gemini
-    client = get_client()
-    if not client:
-        print("Error: Gemini client not initialized. Skipping vector store build.")
+def get_index_version(store_path=STORE_PATH):
+    """
+    Returns the version of the resident index, or None if nothing is loaded.
+    """
+    entry = _stores.get(store_path)
+    return entry[0].version if entry else None
+
+def _embedding_available():
+    return time.monotonic() >= _embedding_cooldown_until
+
+def _note_rate_limit():
+    global _embedding_cooldown_until
+    _embedding_cooldown_until = time.monotonic() + EMBEDDING_COOLDOWN_SECONDS
+    print(f"Embedding API rate-limited. Using lexical search for the next {EMBEDDING_COOLDOWN_SECONDS}s.")
+
+def _query_embedder(store):
+    # Queries must be embedded by the backend the generation was built with
+    return embedder_for(store.meta.get("embedding_model", EMBEDDING_MODEL))
+
+def _resolve_mode(store, mode):
+    mode = (mode or os.getenv("SEARCH_MODE", "hybrid")).lower()
+    if mode not in SEARCH_MODES:
+        raise ValueError(f"Unknown search mode '{mode}'. Expected one of {', '.join(SEARCH_MODES)}.")
+    if store.lexical is None:
+        # Generations built before the lexical index existed
+        return "vector"
+    return mode
+
+def _candidate_pool(store, n_results, vector, query):
+    # Hybrid search needs deeper rankings to fuse than either side alone
+    if vector and query is not None and store.lexical is not None:
+        return max(n_results * HYBRID_POOL_FACTOR, HYBRID_MIN_POOL)
+    return n_results
+
+def case_filter(store, case_id):
+    """
+    Rows a search is restricted to: None for no filter ("All", or a store
+    built before case IDs were recorded), otherwise the case's sorted rows.
+    Membership is the case ID stored with each chunk in the generation, so
+    it always matches what was indexed.
+    """
+    if not case_id or case_id == "All":
         return None
+    rows = store.case_rows(case_id)
+    if rows is None:
+        print("Warning: Vector store has no case IDs; searching all cases. Re-ingest to filter by case.")
+    return rows
+
+def _exact_rankings(store, query_embeddings, k, rows):
+    # Brute-force L2 over just these rows' stored vectors
     import numpy as np
 
+    vectors = store.reconstruct(rows)
+    # Query norms are constant per row of the result, so ranking needs only these terms
+    distances = np.einsum('ij,ij->i', vectors, vectors)[None, :] - 2 * query_embeddings @ vectors.T
+    k = min(k, len(rows))
+    top = np.argpartition(distances, k - 1, axis=1)[:, :k]
+    order = np.take_along_axis(distances, top, axis=1).argsort(axis=1)
+    return [rows[found].tolist() for found in np.take_along_axis(top, order, axis=1)]
+
+def vector_rankings(store, query_embeddings, k, nprobe=None, ef_search=None, rows=None):
+    """
+    Runs one FAISS search for a batch of query vectors and returns each
+    query's ranked rows. rows (see case_filter) limits the search to a
+    subset through an ID selector; small subsets of approximate indexes are
+    scanned exactly instead, since HNSW and IVF can miss filtered neighbours.
+    """
+    if rows is not None and not len(rows):
+        return [[] for _ in query_embeddings]
+    if rows is not None and store.index_type != "flat" and len(rows) * store.index.d <= CASE_EXACT_SEARCH_MAX_VALUES:
+        return _exact_rankings(store, query_embeddings, k, rows)
+    # Extended indexes also need a selector to skip vectors of removed rows
+    selector = store.selector(rows)
+    if selector is None:
+        params = search_parameters(store.index_type, nprobe=nprobe, ef_search=ef_search)
+    else:
+        stored = store.meta.get("index_params") or {}
+        params = search_parameters(store.index_type, nprobe=nprobe or stored.get("nprobe"),
+                                   ef_search=ef_search or stored.get("ef_search"), selector=selector)
+    distances, labels = store.index.search(query_embeddings, k, params=params)
+    return [store.rows_for_labels(found) for found in labels]
+
+def search_store(store, query_embedding=None, n_results=1, nprobe=None, ef_search=None, query=None,
+                 vector_ranking=None, case_id=None):
+    """
+    Searches a loaded store. With query_embedding it runs a vector search;
+    with query text (and a lexical index) a BM25 search; with both, the two
+    rankings are fused by reciprocal rank. Only the texts of the returned
+    rows are read from the documents file. nprobe (IVF) and ef_search (HNSW)
+    override the index's stored search settings. vector_ranking passes in a
+    vector search already run as part of a batch. case_id restricts both
+    rankings to that case's chunks.
+    """
+    rows = case_filter(store, case_id)
+    use_lexical = query is not None and store.lexical is not None
+    hybrid = query_embedding is not None and use_lexical
+    pool = _candidate_pool(store, n_results, query_embedding is not None, query)
+    rankings = []
+
+    if query_embedding is not None:
+        if query_embedding.shape[1] != store.index.d:
+            print(f"Error: Query embedding has dimension {query_embedding.shape[1]}, "
+                  f"but the index was built with {store.index.d}. Please rebuild it.")
+            return {"documents": [[]], "metadatas": [[]]}
+
+        # Search
+        if vector_ranking is None:
+            with span("vector_search"):
+                vector_ranking = vector_rankings(store, query_embedding, pool, nprobe, ef_search, rows)[0]
+        rankings.append(vector_ranking)
+
+    if use_lexical:
+        with span("lexical_search"):
+            rankings.append([row for row, _ in store.lexical.search(query, pool, rows)])
+
+    rows = reciprocal_rank_fusion(rankings, n_results) if hybrid else (rankings[0] if rankings else [])
     
-    # Gemini text-embedding-004 (or gemini-embedding-001)
-    # We batch documents to avoid too many API calls
-    all_embeddings = []
-    batch_size = 50
-    for i in range(0, len(documents), batch_size):
-        batch = documents[i:i + batch_size]
-        
-        # Retry logic for rate limits
-        retries = 3
-        delay = 10
-        for attempt in range(retries):
-            try:
-                response = client.models.embed_content(
-                    model='gemini-embedding-001',
-                    contents=batch
-                )
-                batch_embeddings = [e.values for e in response.embeddings]
-                all_embeddings.extend(batch_embeddings)
-                break
-            except Exception as e:
-                if "429" in str(e) and attempt < retries - 1:
-                    print(f"Embedding rate limit hit. Waiting {delay}s (Attempt {attempt+1})...")
-                    time.sleep(delay)
-                    delay *= 2
-                    continue
-                raise e
-        
-    embeddings = np.array(all_embeddings).astype('float32')
-    
-    # Initialize FAISS index
-    import faiss
-    dimension = embeddings.shape[1]
-    index = faiss.IndexFlatL2(dimension)
-    index.add(embeddings)
-    
-    # Save index and metadata
-    with open(store_path, "wb") as f:
-        pickle.dump({"index": index, "metadatas": metadatas, "documents": documents}, f)
-    
-    return index
+    # Format results to mimic ChromaDB structure for compatibility
+    res_docs = []
+    res_metas = []
+    with span("fetch_documents"):
+        for row in rows:
+            res_docs.append(store.document(row))
+            res_metas.append(store.metadata(row))
+    # Rows and version let context_assembler fetch the stored vectors
+    results = {"documents": [res_docs], "metadatas": [res_metas],
+               "ids": [[int(store.ids[row]) for row in rows]],
+               "rows": [list(rows)], "version": store.version}
+    if query_embedding is not None:
+        # Kept for the semantic answer cache, which compares query vectors
+        results["query_embedding"] = query_embedding[0]
+    return results
+
+def _empty_case(store, case_id):
+    # An empty store, or a case with no chunks, needs neither an embedding
+    # call nor a search
+    if not len(store):
+        return True
+    rows = case_filter(store, case_id)
+    return rows is not None and not len(rows)
 
-def blind_search(query, n_results=1, store_path="vector_store.pkl"):
+def blind_search(query, n_results=1, store_path=STORE_PATH, nprobe=None, ef_search=None, mode=None,
+                 case_id=None):
     """
-    Performs a similarity search using Gemini embeddings and FAISS.
+    Performs a similarity search using the store's embedder and FAISS.
+    mode is "vector", "lexical" (BM25 only, no embedding call) or "hybrid"
+    (both, fused); it defaults to SEARCH_MODE or "hybrid". If the embedding
+    API is rate-limited or unavailable, search falls back to lexical only.
+    case_id limits the search to one case's evidence ("All" or None: every case).
     """
-    if not os.path.exists(store_path):
+    with span("store_load"):
+        store = get_store(store_path)
+    if store is None:
         print("Error: Vector store not found. Please build it first.")
         return {"documents": [[]], "metadatas": [[]]}
-        
-    with open(store_path, "rb") as f:
-        data = pickle.load(f)
-        index = data["index"]
-        metadatas = data["metadatas"]
-        documents = data["documents"]
+    mode = _resolve_mode(store, mode)
+    lexical_query = query if mode != "vector" else None
+    if mode == "lexical" or _empty_case(store, case_id):
+        return search_store(store, None, n_results, query=query, case_id=case_id)
     
-    # Embed query using Gemini
-    client = get_client()
-    if not client:
-        print("Error: Gemini client not initialized. Skipping search.")
+    # Embed query with the backend that built the store
+    embedder = _query_embedder(store)
+    if not embedder.available() or (store.lexical is not None and not _embedding_available()):
+        if store.lexical is not None:
+            SEARCH_FALLBACKS.inc()
+            return search_store(store, None, n_results, query=query, case_id=case_id)
+        print(f"Error: Embedding backend {embedder.name} not available. Skipping search.")
         return {"documents": [[]], "metadatas": [[]]}
     import numpy as np
 
-    
-    response = client.models.embed_content(
-        model='gemini-embedding-001',
-        contents=query
-    )
-    query_embedding = np.array([response.embeddings[0].values]).astype('float32')
-    
-    # Search
-    distances, indices = index.search(query_embedding, n_results)
-    
-    # Format results to mimic ChromaDB structure for compatibility
-    res_docs = []
-    res_metas = []
-    for idx in indices[0]:
-        if idx != -1 and idx < len(documents):
-            res_docs.append(documents[idx])
-            res_metas.append(metadatas[idx])
-            
-    return {"documents": [res_docs], "metadatas": [res_metas]}
+    try:
+        # With a lexical fallback there's no point sleeping through 429 retries
+        retries = 1 if store.lexical is not None else 3
+        with span("query_embed"):
+            query_embedding = np.array(embedder.embed([query], retries=retries)).astype('float32')
+    except Exception as e:
+        if store.lexical is None or not is_rate_limit(e):
+            raise
+        _note_rate_limit()
+        SEARCH_FALLBACKS.inc()
+        return search_store(store, None, n_results, query=query, case_id=case_id)
+    return search_store(store, query_embedding, n_results, nprobe=nprobe, ef_search=ef_search,
+                        query=lexical_query, case_id=case_id)
+
+async def _embed_batch(key, texts):
+    embedder, retries = key
+    return await embedder.embed_async(texts, retries=retries)
+
+async def _search_batch(key, vectors):
+    import numpy as np
+
+    store, k, nprobe, ef_search, case_id = key
+    return await asyncio.to_thread(vector_rankings, store, np.vstack(vectors), k, nprobe, ef_search,
+                                   case_filter(store, case_id))
+
+def get_query_batchers():
+    """
+    Returns the (embedding, search) micro-batchers shared by async queries.
+    """
+    global _embed_batcher, _search_batcher
+    if _embed_batcher is None:
+        window_ms, max_batch = batch_settings()
+        _embed_batcher = MicroBatcher(_embed_batch, window_ms, max_batch)
+        _search_batcher = MicroBatcher(_search_batch, window_ms, max_batch)
+    return _embed_batcher, _search_batcher
+
+async def blind_search_async(query, n_results=1, store_path=STORE_PATH, nprobe=None, ef_search=None, mode=None,
+                             case_id=None):
+    """
+    Non-blocking blind_search: awaits the embedder (the Gemini async client,
+    or a worker thread for local backends) and runs disk loads and the FAISS
+    search off the event loop. Queries arriving within a few milliseconds of
+    each other share one embedding call and one FAISS search (per case).
+    """
+    with span("store_load"):
+        store = await asyncio.to_thread(get_store, store_path)
+    if store is None:
+        print("Error: Vector store not found. Please build it first.")
+        return {"documents": [[]], "metadatas": [[]]}
+    mode = _resolve_mode(store, mode)
+    lexical_query = query if mode != "vector" else None
+    if mode == "lexical" or _empty_case(store, case_id):
+        return await asyncio.to_thread(search_store, store, None, n_results, query=query, case_id=case_id)
+
+    embedder = _query_embedder(store)
+    if not embedder.available() or (store.lexical is not None and not _embedding_available()):
+        if store.lexical is not None:
+            SEARCH_FALLBACKS.inc()
+            return await asyncio.to_thread(search_store, store, None, n_results, query=query, case_id=case_id)
+        print(f"Error: Embedding backend {embedder.name} not available. Skipping search.")
+        return {"documents": [[]], "metadatas": [[]]}
+    import numpy as np
+
+    embed_batcher, search_batcher = get_query_batchers()
+    try:
+        retries = 1 if store.lexical is not None else 3
+        with span("query_embed"):
+            vector = await embed_batcher.submit((embedder, retries), query)
+        query_embedding = np.array([vector]).astype('float32')
+    except Exception as e:
+        if store.lexical is None or not is_rate_limit(e):
+            raise
+        _note_rate_limit()
+        SEARCH_FALLBACKS.inc()
+        return await asyncio.to_thread(search_store, store, None, n_results, query=query, case_id=case_id)
+    ranking = None
+    if query_embedding.shape[1] == store.index.d:
+        pool = _candidate_pool(store, n_results, True, lexical_query)
+        with span("vector_search"):
+            ranking = await search_batcher.submit((store, pool, nprobe, ef_search, case_id), query_embedding[0])
+    return await asyncio.to_thread(search_store, store, query_embedding, n_results,
+                                   nprobe=nprobe, ef_search=ef_search, query=lexical_query,
+                                   vector_ranking=ranking, case_id=case_id)
 
 if __name__ == "__main__":
-    from ingest import ingest_evidence
-    # 1. Load data from Phase 1
+    from ingest import iter_evidence
+    # 1. Stream data from Phase 1
     evidence_path = "evidence"
-    data = ingest_evidence(evidence_path)
     
     # 2. Build the store
-    if data:
-        print("Building vector store (FAISS + Gemini)...")
-        build_vector_store(data)
+    print(f"Building vector store (FAISS + {get_embedder().name})...")
+    if build_vector_store(iter_evidence(evidence_path)):
         
         # 3. [Milestone Check] The "Blind" Search
         query = "What color was the car?"